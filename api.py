@@ -0,0 +1,92 @@
+import gzip
+import unicodedata
+from datetime import datetime, timezone
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+WORD_FIELDS = ('word', 'translation', 'partOfSpeech', 'examples', 'categories', 'updatedAt')
+MIN_COMPRESS_SIZE = 500
+MAX_LOOKUP_WORDS = 500
+LOOKUP_PROJECTION = {'word': 1, 'translation': 1, 'partOfSpeech': 1, 'part_of_speech': 1}
+
+def parse_fields(value):
+    # ?fields=word,translation -> projection; unknown names are rejected rather than silently ignored.
+    if not value:
+        fields = WORD_FIELDS
+    else:
+        fields = tuple(name.strip() for name in value.split(',') if name.strip())
+        unknown = [name for name in fields if name not in WORD_FIELDS]
+        if unknown:
+            raise ValueError('unknown field(s): %s' % ', '.join(unknown))
+    projection = {name: 1 for name in fields}
+    if 'partOfSpeech' in fields:
+        projection['part_of_speech'] = 1
+    return fields, projection
+
+def parse_since(value):
+    since = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    return since
+
+def normalize_word(text):
+    # NFC so decomposed "a" + combining diaeresis from a web page equals the stored "ä"; case is left to the collation.
+    return unicodedata.normalize('NFC', ' '.join(text.split())).lower()
+
+def parse_lookup(body):
+    # {"words": [...]} -> unique normalized words in request order.
+    words = body.get('words') if isinstance(body, dict) else None
+    if not isinstance(words, list) or not all(isinstance(word, str) for word in words):
+        raise ValueError('expected {"words": [...]} with a list of strings')
+    words = list(dict.fromkeys(word for word in map(normalize_word, words) if word))
+    if len(words) > MAX_LOOKUP_WORDS:
+        raise ValueError('at most %d words per lookup' % MAX_LOOKUP_WORDS)
+    return words
+
+def lookup_json(doc, match):
+    return {
+        'id': str(doc['_id']),
+        'word': doc.get('word', ''),
+        'translation': doc.get('translation', ''),
+        'partOfSpeech': doc.get('partOfSpeech') or doc.get('part_of_speech', ''),
+        'match': match,
+    }
+
+def isoformat(value):
+    if value is None:
+        return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc).isoformat().replace('+00:00', 'Z')
+
+def word_json(doc, fields):
+    item = {'id': str(doc['_id'])}
+    for name in fields:
+        if name == 'partOfSpeech':
+            item[name] = doc.get('partOfSpeech') or doc.get('part_of_speech', '')
+        elif name == 'updatedAt':
+            item[name] = isoformat(doc.get('updatedAt'))
+        elif name in ('examples', 'categories'):
+            item[name] = doc.get(name) or []
+        else:
+            item[name] = doc.get(name, '')
+    return item
+
+def compress(response, accept_encodings):
+    if (response.direct_passthrough or response.status_code != 200
+            or 'Content-Encoding' in response.headers):
+        return response
+    data = response.get_data()
+    if len(data) < MIN_COMPRESS_SIZE:
+        return response
+    if brotli is not None and 'br' in accept_encodings:
+        response.set_data(brotli.compress(data, quality=5))
+        response.headers['Content-Encoding'] = 'br'
+    elif 'gzip' in accept_encodings:
+        response.set_data(gzip.compress(data, compresslevel=6))
+        response.headers['Content-Encoding'] = 'gzip'
+    response.vary.add('Accept-Encoding')
+    return response
@@ -0,0 +1,113 @@
+# Async serving mode: the read-heavy pages (/, /categories, /statistics) run as async views on
+# PyMongo's AsyncMongoClient; every other route is handed to the regular Flask app.
+#
+#   uvicorn asgi:app --workers 4
+import contextlib
+import functools
+from urllib.parse import quote
+
+from a2wsgi import WSGIMiddleware
+from bson import ObjectId
+from itsdangerous import BadSignature
+from pymongo import AsyncMongoClient
+from starlette.applications import Starlette
+from starlette.responses import HTMLResponse, RedirectResponse
+from starlette.routing import Mount, Route
+
+import database
+import main
+import stats
+from ownership import visible
+from models import (VocabEntry, Category, User, VOCAB_PROJECTION, CATEGORY_PROJECTION, USER_SESSION_PROJECTION,
+                    with_counts)
+
+adb = None
+
+# Sessions are the signed Flask session cookie, so logging in through either app works for both.
+session_serializer = main.app.session_interface.get_signing_serializer(main.app)
+session_cookie = main.app.config['SESSION_COOKIE_NAME']
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    # The client is created inside the worker's event loop, after any fork.
+    global adb
+    client = AsyncMongoClient(database.settings['uri'], **database.client_options())
+    adb = client[database.settings['database']]
+    yield
+    await client.close()
+
+async def load_user(request):
+    cookie = request.cookies.get(session_cookie)
+    if not cookie:
+        return None
+    try:
+        session = session_serializer.loads(cookie, max_age=int(main.app.permanent_session_lifetime.total_seconds()))
+    except BadSignature:
+        return None
+    user_id = session.get('_user_id')
+    if not user_id or not ObjectId.is_valid(user_id):
+        return None
+    user = main.user_cache.get(user_id)
+    if user is None:
+        user_doc = await adb['users'].find_one({'_id': ObjectId(user_id)}, USER_SESSION_PROJECTION)
+        if user_doc is None:
+            return None
+        user = main.remember_user(User(user_doc))
+    return user
+
+def login_required(view):
+    @functools.wraps(view)
+    async def wrapper(request):
+        user = await load_user(request)
+        if user is None:
+            return RedirectResponse('/login?next=' + quote(request.url.path), status_code=302)
+        return await view(request, user)
+    return wrapper
+
+def render(template, **context):
+    # Same compiled templates as the Flask app. current_user is passed in explicitly and flashed messages,
+    # which live in the Flask session, are left for the next Flask-served page to show.
+    return HTMLResponse(main.app.extensions['templates'][template].render(get_flashed_messages=lambda: [], **context))
+
+@login_required
+async def index(request, user):
+    size = main.page_size_arg(request.query_params)
+    after = main.parse_cursor(request.query_params.get('after'))
+    before = main.parse_cursor(request.query_params.get('before'))
+    query, order = main.keyset_query(visible(ObjectId(user.id)), after, before)
+    cursor = adb['vocabulary'].find(query, VOCAB_PROJECTION).sort('_id', order).limit(size + 1).batch_size(size + 1)
+    docs, prev_cursor, next_cursor = main.keyset_result(await cursor.to_list(size + 1), after, before, size)
+    return render('index', current_user=user, entries=[VocabEntry.from_doc(doc) for doc in docs],
+                  prev_cursor=prev_cursor, next_cursor=next_cursor, size=size)
+
+async def load_stats(owner_id, refresh=False):
+    # stats.load() on the async driver: the stored document, recomputed when stale or asked to.
+    doc = None if refresh else await adb['stats'].find_one({'_id': owner_id})
+    if stats.is_stale(doc):
+        cursor = await adb['vocabulary'].aggregate(stats.pipeline(owner_id))
+        doc = stats.stats_doc((await cursor.to_list(1))[0], owner_id)
+        await adb['stats'].replace_one({'_id': owner_id}, doc, upsert=True)
+    return doc
+
+@login_required
+async def categories(request, user):
+    cursor = adb['categories'].find({}, CATEGORY_PROJECTION)
+    cats = [Category.from_doc(doc) async for doc in cursor]
+    counts = stats.category_counts(await load_stats(ObjectId(user.id)), await load_stats(stats.SHARED))
+    return render('categories', current_user=user, cats=with_counts(cats, counts))
+
+@login_required
+async def statistics(request, user):
+    word_stats = stats.summarize(await load_stats(ObjectId(user.id), refresh=request.query_params.get('refresh') == '1'))
+    return render('statistics', current_user=user, total_vocab=word_stats['total'],
+                  total_categories=await adb['categories'].estimated_document_count(),
+                  total_users=await adb['users'].estimated_document_count(),
+                  by_category=word_stats['by_category'], by_part_of_speech=word_stats['by_part_of_speech'],
+                  computed_at=word_stats['computed_at'])
+
+app = Starlette(lifespan=lifespan, routes=[
+    Route('/', index),
+    Route('/categories', categories),
+    Route('/statistics', statistics),
+    Mount('/', WSGIMiddleware(main.app)),
+])
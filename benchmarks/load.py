@@ -0,0 +1,142 @@
+# Concurrent HTTP load generator (asyncio, keep-alive connections, no third-party packages).
+# Logs in once, then has --concurrency clients request the given paths round-robin for --duration seconds.
+#
+#   python -m benchmarks.load http://127.0.0.1:8000 --email a@b.c --password secret --concurrency 500
+import argparse
+import asyncio
+import json
+import time
+from urllib.parse import urlencode, urlsplit
+
+DEFAULT_PATHS = ['/', '/categories', '/statistics']
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, int(round(pct / 100.0 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+def summarize(latencies, errors, elapsed):
+    latencies = sorted(latencies)
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'rps': round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+    }
+
+class Connection:
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = None
+        self.writer = None
+
+    async def request(self, method, path, headers=None, body=b''):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        lines = ['%s %s HTTP/1.1' % (method, path), 'Host: %s:%d' % (self.host, self.port),
+                 'Content-Length: %d' % len(body)]
+        lines += ['%s: %s' % item for item in (headers or {}).items()]
+        self.writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body)
+        await self.writer.drain()
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionError('server closed the connection')
+        status = int(status_line.split()[1])
+        response_headers = {}
+        cookies = []
+        while True:
+            line = (await self.reader.readline()).decode('latin-1')
+            if line in ('\r\n', '\n', ''):
+                break
+            name, value = line.split(':', 1)
+            name = name.strip().lower()
+            if name == 'set-cookie':
+                cookies.append(value.strip())
+            response_headers[name] = value.strip()
+        if 'content-length' in response_headers:
+            data = await self.reader.readexactly(int(response_headers['content-length']))
+        elif response_headers.get('transfer-encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size = int((await self.reader.readline()).split(b';')[0], 16)
+                if size == 0:
+                    await self.reader.readline()
+                    break
+                chunks.append(await self.reader.readexactly(size))
+                await self.reader.readline()
+            data = b''.join(chunks)
+        else:
+            data = await self.reader.read()
+            response_headers['connection'] = 'close'
+        if response_headers.get('connection', '').lower() == 'close' or status_line.startswith(b'HTTP/1.0'):
+            self.close()
+        return status, response_headers, cookies, data
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+async def login(host, port, email, password):
+    connection = Connection(host, port)
+    body = urlencode({'email': email, 'password': password}).encode()
+    status, _, cookies, _ = await connection.request(
+        'POST', '/login', {'Content-Type': 'application/x-www-form-urlencoded'}, body)
+    connection.close()
+    session = [cookie.split(';', 1)[0] for cookie in cookies if cookie.startswith('session=')]
+    if status != 302 or not session:
+        raise SystemExit('login failed (HTTP %d)' % status)
+    return session[0]
+
+async def run(base_url, paths, concurrency, duration, email=None, password=None):
+    parts = urlsplit(base_url)
+    host, port = parts.hostname, parts.port or 80
+    headers = {}
+    if email:
+        headers['Cookie'] = await login(host, port, email, password)
+    latencies = {path: [] for path in paths}
+    errors = {'count': 0}
+    deadline = time.perf_counter() + duration
+
+    async def client(offset):
+        connection = Connection(host, port)
+        i = offset
+        while time.perf_counter() < deadline:
+            path = paths[i % len(paths)]
+            i += 1
+            start = time.perf_counter()
+            try:
+                status, _, _, _ = await connection.request('GET', path, headers)
+            except (OSError, ConnectionError, asyncio.IncompleteReadError, ValueError):
+                connection.close()
+                errors['count'] += 1
+                continue
+            if status >= 400:
+                errors['count'] += 1
+                continue
+            latencies[path].append(time.perf_counter() - start)
+        connection.close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client(i) for i in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    result = summarize([value for values in latencies.values() for value in values], errors['count'], elapsed)
+    result['concurrency'] = concurrency
+    result['by_path'] = {path: summarize(values, 0, elapsed) for path, values in latencies.items()}
+    return result
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('base_url')
+    parser.add_argument('--paths', nargs='+', default=DEFAULT_PATHS)
+    parser.add_argument('--concurrency', type=int, default=500)
+    parser.add_argument('--duration', type=float, default=30)
+    parser.add_argument('--email')
+    parser.add_argument('--password')
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args.base_url, args.paths, args.concurrency, args.duration,
+                                     args.email, args.password)), indent=2))
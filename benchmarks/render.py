@@ -0,0 +1,67 @@
+# Compares per-request template CPU time: compiling the page source on every request
+# (what render_template_string did) against rendering the precompiled registry entry.
+#
+#   python -m benchmarks.render [--requests 2000] [--words 50]
+import argparse
+import json
+import time
+
+from bson import ObjectId
+from flask import render_template_string
+
+import main
+from models import VocabEntry, Category, UserSummary
+
+def sample_words(count):
+    return [VocabEntry.from_doc({
+        '_id': ObjectId(),
+        'word': 'sana%d' % i,
+        'translation': 'word %d' % i,
+        'partOfSpeech': 'noun',
+        'examples': ['Tämä on sana %d.' % i],
+        'categories': ['A1 Basics', 'Home & Living'],
+    }) for i in range(count)]
+
+def contexts(words):
+    docs = sample_words(words)
+    return {
+        'register': {},
+        'login': {},
+        'index': {'entries': docs, 'prev_cursor': None, 'next_cursor': docs[-1].id, 'size': words},
+        'edit': {'entry': docs[0]},
+        'add': {},
+        'categories': {'cats': [Category('Category %d' % i, 'About %d' % i) for i in range(20)]},
+        'statistics': {'total_vocab': 40000, 'total_categories': 20, 'total_users': 10, 'computed_at': None,
+                       'by_category': [('Category %d' % i, 2000) for i in range(20)],
+                       'by_part_of_speech': [('noun', 25000), ('verb', 10000), ('adjective', 5000)]},
+        'users': {'users_list': [UserSummary('User %d' % i, 'user%d@example.com' % i) for i in range(20)]},
+    }
+
+def cpu_per_call(fn, requests):
+    start = time.process_time()
+    for _ in range(requests):
+        fn()
+    return (time.process_time() - start) / requests * 1000
+
+def run(requests, words):
+    results = {}
+    loader = main.app.jinja_env.loader
+    with main.app.test_request_context('/'):
+        for name, context in contexts(words).items():
+            # Only the page itself is recompiled here (base.html stays cached), so the saving is a lower bound.
+            source = loader.get_source(main.app.jinja_env, name + '.html')[0]
+            before = cpu_per_call(lambda: render_template_string(source, **context), requests)
+            after = cpu_per_call(lambda: main.render(name, **context), requests)
+            results[name] = {
+                'before_ms': round(before, 4),
+                'after_ms': round(after, 4),
+                'saved_ms': round(before - after, 4),
+            }
+    return results
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--words', type=int, default=50)
+    args = parser.parse_args()
+    print(json.dumps(run(args.requests, args.words), indent=2))
@@ -0,0 +1,156 @@
+# Route-level benchmark: seeds a throwaway database with a reproducible dataset, drives every page through
+# the Flask test client and prints throughput and latency percentiles per route as JSON.
+#
+#   python -m benchmarks.routes --words 40000 --output bench.json
+#   python -m benchmarks.routes --backend mongomock --words 5000
+#   python -m benchmarks.routes --http http://127.0.0.1:5000 --concurrency 200   (server must use the same database)
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import time
+
+from werkzeug.security import generate_password_hash
+
+import database
+import main
+from ownership import owned
+from benchmarks import load
+
+PASSWORD = 'benchmark'
+SYLLABLES = ['ka', 'ki', 'ko', 'ku', 'ta', 'te', 'ti', 'sa', 'si', 'la', 'le', 'mä', 'nä', 'pö', 'vä', 'ssa', 'nen', 'kin']
+PARTS_OF_SPEECH = ['noun', 'verb', 'adjective', 'adverb', 'pronoun']
+SHARED_FRACTION = 0.05
+
+def word(rng):
+    return ''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4)))
+
+def seed(db, users, words, categories, seed_value=42, batch=1000):
+    rng = random.Random(seed_value)
+    for name in db.list_collection_names():
+        db.drop_collection(name)
+    # One hash shared by every user: seeding should not take minutes of scrypt.
+    password = generate_password_hash(PASSWORD)
+    owner_ids = db['users'].insert_many([{'name': 'User %d' % i, 'email': 'user%d@bench.local' % i, 'password': password}
+                                         for i in range(users)]).inserted_ids if users else [None]
+    category_names = ['Category %d' % i for i in range(categories)]
+    if category_names:
+        db['categories'].insert_many([{'name': name, 'description': 'Seeded category'} for name in category_names])
+    for start in range(0, words, batch):
+        db['vocabulary'].insert_many([{
+            'word': word(rng),
+            'translation': word(rng),
+            'partOfSpeech': rng.choice(PARTS_OF_SPEECH),
+            'examples': [' '.join(word(rng) for _ in range(4))],
+            'categories': rng.sample(category_names, min(2, len(category_names))),
+            # Words are spread evenly over the users, a few of them shared with everyone.
+            'ownerId': rng.choice(owner_ids),
+            'shared': rng.random() < SHARED_FRACTION,
+        } for _ in range(start, min(start + batch, words))])
+
+def use_database(db):
+    # Point the app at the benchmark database and drop everything it cached about the old one.
+    database.use_database(db)
+    main.indexes_ready = False
+    main.user_cache.clear()
+    main.search_index.invalidate()
+    main.vocabulary_cache.clear()
+    # Every login comes from the same address here; the per-IP throttle would turn them into 429s.
+    main.login_throttle.attempts = float('inf')
+
+def timed(latencies, fn):
+    start = time.perf_counter()
+    response = fn()
+    latencies.append(time.perf_counter() - start)
+    if response.status_code >= 400:
+        raise SystemExit('%s returned HTTP %d' % (response.request.path, response.status_code))
+
+def run_routes(db, requests):
+    client = main.app.test_client()
+    credentials = {'email': 'user0@bench.local', 'password': PASSWORD}
+    client.post('/login', data=credentials)
+    # Only the logged-in user's own words can be edited or deleted.
+    user_id = db['users'].find_one({'email': credentials['email']}, {'_id': 1})['_id']
+    ids = [doc['_id'] for doc in db['vocabulary'].find(owned(user_id), {'_id': 1}).sort('_id', 1).limit(requests * 2)]
+    edit_ids, delete_ids = [str(id) for id in ids[:requests]], ids[requests:]
+    if len(delete_ids) < requests:
+        raise SystemExit('user0 needs at least %d words for %d requests per route; seed more words or fewer users'
+                         % (requests * 2, requests))
+    form = {'word': 'uusi', 'translation': 'new', 'partOfSpeech': 'adjective', 'examples': 'Uusi sana', 'categories': 'Category 0'}
+    routes = {
+        'GET /': lambda i: client.get('/'),
+        'GET /add': lambda i: client.get('/add'),
+        'POST /add': lambda i: client.post('/add', data=form),
+        'GET /edit/<id>': lambda i: client.get('/edit/' + edit_ids[i]),
+        'POST /edit/<id>': lambda i: client.post('/edit/' + edit_ids[i], data=form),
+        'GET /delete/<id>': lambda i: client.get('/delete/%s' % delete_ids[i]),
+        'GET /categories': lambda i: client.get('/categories'),
+        'GET /statistics': lambda i: client.get('/statistics'),
+        'GET /users': lambda i: client.get('/users'),
+        'POST /login': lambda i: client.post('/login', data=credentials),
+    }
+    client.get('/')  # warm-up: index bootstrap, template globals
+    results = {}
+    for name, request in routes.items():
+        latencies = []
+        started = time.perf_counter()
+        for i in range(requests):
+            timed(latencies, lambda: request(i))
+        results[name] = load.summarize(latencies, 0, time.perf_counter() - started)
+    # A delete that matched nothing still redirects, so check the words are really gone.
+    left = db['vocabulary'].count_documents({'_id': {'$in': delete_ids}})
+    if left:
+        raise SystemExit('GET /delete/<id> left %d of %d words in place' % (left, len(delete_ids)))
+    return results
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def open_database(backend, name):
+    if backend == 'mongomock':
+        import mongomock
+        return mongomock.MongoClient()[name]
+    return database.get_client()[name]
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--backend', choices=['mongodb', 'mongomock'], default='mongodb')
+    parser.add_argument('--database', default=os.getenv('MONGODB_DATABASE', 'Vocabulary-finnish') + '-bench')
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--words', type=int, default=10000)
+    parser.add_argument('--categories', type=int, default=30)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--requests', type=int, default=200, help='requests per route')
+    parser.add_argument('--no-seed', action='store_true', help='reuse the data already in --database')
+    parser.add_argument('--http', help='also load-test a running server at this base URL')
+    parser.add_argument('--concurrency', type=int, default=100)
+    parser.add_argument('--duration', type=float, default=20)
+    parser.add_argument('--output', help='write the JSON report to this file as well')
+    args = parser.parse_args()
+
+    db = open_database(args.backend, args.database)
+    if not args.no_seed:
+        seed(db, args.users, args.words, args.categories, args.seed)
+    use_database(db)
+    report = {
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'backend': args.backend,
+        'dataset': {'users': args.users, 'words': args.words, 'categories': args.categories, 'seed': args.seed},
+        'requests_per_route': args.requests,
+        'routes': run_routes(db, args.requests),
+    }
+    if args.http:
+        report['http'] = asyncio.run(load.run(args.http, load.DEFAULT_PATHS + ['/users'], args.concurrency,
+                                              args.duration, 'user0@bench.local', PASSWORD))
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
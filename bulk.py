@@ -0,0 +1,37 @@
+from bson import ObjectId
+
+ACTIONS = ('delete', 'add_category', 'remove_category', 'set_part_of_speech')
+MAX_IDS = 1000
+BULK_FIELDS = {'word': 1, 'translation': 1, 'partOfSpeech': 1, 'part_of_speech': 1, 'categories': 1, 'ownerId': 1,
+               'shared': 1}
+
+def parse_ids(values):
+    ids = list(dict.fromkeys(ObjectId(value) for value in values if ObjectId.is_valid(str(value))))
+    if not ids:
+        raise ValueError('no valid word ids given')
+    if len(ids) > MAX_IDS:
+        raise ValueError('at most %d words per request' % MAX_IDS)
+    return ids
+
+def update_for(action, value, now):
+    # Returns the update_many document and a function giving a word's new fields (None if it would not change),
+    # so statistics and the search index can be adjusted without re-reading the words.
+    if action == 'add_category':
+        def transform(doc):
+            categories = doc.get('categories') or []
+            return None if value in categories else dict(doc, categories=categories + [value])
+        return {'$addToSet': {'categories': value}, '$set': {'updatedAt': now}}, transform
+    if action == 'remove_category':
+        def transform(doc):
+            categories = doc.get('categories') or []
+            return dict(doc, categories=[c for c in categories if c != value]) if value in categories else None
+        return {'$pull': {'categories': value}, '$set': {'updatedAt': now}}, transform
+    if action == 'set_part_of_speech':
+        def transform(doc):
+            if doc.get('partOfSpeech') == value and 'part_of_speech' not in doc:
+                return None
+            after = dict(doc, partOfSpeech=value)
+            after.pop('part_of_speech', None)
+            return after
+        return {'$set': {'partOfSpeech': value, 'updatedAt': now}, '$unset': {'part_of_speech': ''}}, transform
+    raise ValueError('unknown action: %s' % action)
@@ -0,0 +1,57 @@
+import os
+import threading
+
+from pymongo import MongoClient
+
+settings = {}
+_lock = threading.Lock()
+_client = None
+_pid = None
+_override = None
+
+def configure(config, event_listeners=()):
+    settings.update(
+        uri=config['MONGODB_URI'],
+        database=config['MONGODB_DATABASE'],
+        max_pool_size=int(config['MONGODB_MAX_POOL_SIZE']),
+        min_pool_size=int(config['MONGODB_MIN_POOL_SIZE']),
+        timeout_ms=int(config['MONGODB_TIMEOUT_MS']),
+        socket_timeout_ms=int(config['MONGODB_SOCKET_TIMEOUT_MS']),
+        read_preference=config['MONGODB_READ_PREFERENCE'],
+        event_listeners=list(event_listeners),
+    )
+
+def client_options():
+    options = {
+        'maxPoolSize': settings['max_pool_size'],
+        'minPoolSize': settings['min_pool_size'],
+        'serverSelectionTimeoutMS': settings['timeout_ms'],
+        'connectTimeoutMS': settings['timeout_ms'],
+        'readPreference': settings['read_preference'],
+        'event_listeners': settings['event_listeners'],
+    }
+    if settings['socket_timeout_ms']:
+        options['socketTimeoutMS'] = settings['socket_timeout_ms']
+    return options
+
+def get_client():
+    # One client per process, created on first use. A client inherited through fork() is never reused:
+    # its sockets and monitor threads belong to the parent, so the child builds its own.
+    global _client, _pid
+    pid = os.getpid()
+    if _client is None or _pid != pid:
+        with _lock:
+            if _client is None or _pid != pid:
+                _client = MongoClient(settings['uri'], connect=False, **client_options())
+                _pid = pid
+    return _client
+
+def get_db():
+    if _override is not None:
+        return _override
+    return get_client()[settings['database']]
+
+def use_database(db):
+    # Points the app at another database object (e.g. a seeded benchmark database or mongomock).
+    global _override
+    _override = db
@@ -0,0 +1,113 @@
+from datetime import datetime, timezone
+
+from bson import ObjectId
+from pymongo import ASCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+from ownership import owned, visible, visible_tombstones
+
+FINNISH = {'locale': 'fi', 'strength': 2}
+
+INDEXES = {
+    'users': [
+        IndexModel([('email', ASCENDING)], name='email_unique', unique=True),
+    ],
+    'vocabulary': [
+        IndexModel([('word', ASCENDING)], name='word'),
+        # Case-insensitive word lookups; strength 2 still keeps ä/ö apart from a/o, as Finnish does.
+        IndexModel([('word', ASCENDING)], name='word_fi', collation=FINNISH),
+        # Multikey; the _id suffix lets category pages seek and sort on the index alone.
+        IndexModel([('categories', ASCENDING), ('_id', ASCENDING)], name='categories_id'),
+        IndexModel([('updatedAt', ASCENDING)], name='updatedAt'),
+        # Per-user pages: the user's own words and the shared ones are two index seeks merged on _id.
+        IndexModel([('ownerId', ASCENDING), ('_id', ASCENDING)], name='ownerId_id'),
+        IndexModel([('shared', ASCENDING), ('_id', ASCENDING)], name='shared_id'),
+        IndexModel([('ownerId', ASCENDING), ('categories', ASCENDING), ('_id', ASCENDING)], name='ownerId_categories_id'),
+    ],
+    'deleted_words': [
+        # Tombstones are kept for 90 days; clients that have not synced for longer do a full sync.
+        IndexModel([('deletedAt', ASCENDING)], name='deletedAt_ttl', expireAfterSeconds=90 * 24 * 3600),
+    ],
+    'categories': [
+        IndexModel([('name', ASCENDING)], name='name'),
+    ],
+    'reviews': [
+        IndexModel([('userId', ASCENDING), ('dueAt', ASCENDING)], name='userId_dueAt'),
+        IndexModel([('userId', ASCENDING), ('wordId', ASCENDING)], name='userId_wordId_unique', unique=True),
+    ],
+}
+
+# Superseded by an index above; dropped so writes stop paying for them.
+OBSOLETE_INDEXES = {
+    'vocabulary': ['categories'],
+}
+
+def ensure_indexes(db):
+    # create_indexes is a no-op for indexes that already exist with the same definition. Indexes are created one
+    # at a time, so one that cannot be built (e.g. the unique email index over duplicate emails) does not hold
+    # back the rest. Returns (collection, index name, error) for each index that could not be created.
+    failed = []
+    for collection, models in INDEXES.items():
+        for model in models:
+            try:
+                db[collection].create_indexes([model])
+            except OperationFailure as e:
+                failed.append((collection, model.document['name'], e))
+    for collection, names in OBSOLETE_INDEXES.items():
+        existing = db[collection].index_information()
+        for name in names:
+            if name in existing:
+                db[collection].drop_index(name)
+    return failed
+
+# Every find() shape the app issues, with placeholder values. allow_collscan marks the views that
+# deliberately read a whole (small) collection.
+def query_shapes(db):
+    some_id = ObjectId()
+    return [
+        ('users by email', db['users'].find({'email': 'someone@example.com'}), False),
+        ('users by id', db['users'].find({'_id': some_id}), False),
+        ('users list', db['users'].find({}), True),
+        ('vocabulary first page', db['vocabulary'].find(visible(some_id)).sort('_id', 1).limit(51), False),
+        ('vocabulary next page',
+         db['vocabulary'].find(visible(some_id, {'_id': {'$gt': some_id}})).sort('_id', 1).limit(51), False),
+        ('vocabulary previous page',
+         db['vocabulary'].find(visible(some_id, {'_id': {'$lt': some_id}})).sort('_id', -1).limit(51), False),
+        ('vocabulary owned by user', db['vocabulary'].find(owned(some_id)).sort('_id', 1), False),
+        ('vocabulary by id', db['vocabulary'].find(visible(some_id, {'_id': some_id})), False),
+        ('vocabulary by id, owned', db['vocabulary'].find(owned(some_id, {'_id': some_id})), False),
+        ('vocabulary by word', db['vocabulary'].find(owned(some_id, {'word': 'sana'})), False),
+        ('vocabulary lookup',
+         db['vocabulary'].find(visible(some_id, {'word': {'$in': ['sana', 'päivä']}}), collation=FINNISH), False),
+        ('vocabulary by category',
+         db['vocabulary'].find(visible(some_id, {'categories': 'A1 Basics'})).sort('_id', 1).limit(51), False),
+        ('vocabulary by category, next page',
+         db['vocabulary'].find(visible(some_id, {'categories': 'A1 Basics', '_id': {'$gt': some_id}}))
+         .sort('_id', 1).limit(51), False),
+        ('vocabulary changed since',
+         db['vocabulary'].find(visible(some_id, {'updatedAt': {'$gt': datetime.now(timezone.utc)}})).sort('_id', 1).limit(51),
+         False),
+        ('deleted words since',
+         db['deleted_words'].find(visible_tombstones(some_id, {'deletedAt': {'$gt': datetime.now(timezone.utc)}})), False),
+        ('categories by name', db['categories'].find({'name': 'A1 Basics'}), False),
+        ('categories list', db['categories'].find({}), True),
+        ('due reviews', db['reviews'].find({'userId': some_id, 'dueAt': {'$lte': datetime.now(timezone.utc)}}).sort('dueAt', 1).limit(20), False),
+        ('review states', db['reviews'].find({'userId': some_id, 'wordId': {'$in': [some_id]}}), False),
+    ]
+
+def plan_stages(plan):
+    stages = [plan.get('stage')]
+    for key in ('inputStage', 'queryPlan'):
+        if key in plan:
+            stages += plan_stages(plan[key])
+    for child in plan.get('inputStages', []):
+        stages += plan_stages(child)
+    return [stage for stage in stages if stage]
+
+def check_query_plans(db):
+    results = []
+    for name, cursor, allow_collscan in query_shapes(db):
+        stages = plan_stages(cursor.explain()['queryPlanner']['winningPlan'])
+        failed = 'COLLSCAN' in stages and not allow_collscan
+        results.append((name, stages, failed))
+    return results
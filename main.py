@@ -1,538 +1,798 @@
-from flask import Flask, render_template_string, request, redirect, url_for
-from pymongo import MongoClient
+from flask import (Flask, Blueprint, Response, render_template, stream_template, request, redirect, url_for, abort,
+                   jsonify, stream_with_context, flash, current_app)
+from pymongo import ReturnDocument, ReplaceOne, DeleteOne
+from pymongo.errors import DuplicateKeyError
+import click
 import os
+import hashlib
+import time
+from datetime import datetime, timezone
 from dotenv import load_dotenv
-from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
-from werkzeug.security import generate_password_hash, check_password_hash
+from flask_login import LoginManager, login_user, login_required, logout_user, current_user
 from bson import ObjectId
+from cache import TTLCache
+from database import get_db
+import database
+import ownership
+from ownership import owned, visible
+import stats
+import indexes
+from search import SearchIndex, SEARCH_FIELDS
+from readcache import VocabularyCache
+import transfer
+import api
+from passwords import PasswordHasher, LoginThrottle, HashingBusy
+import metrics
+import bulk
+import review
+from werkzeug.http import is_resource_modified
+from models import (VocabEntry, Category, UserSummary, User, VOCAB_PROJECTION, CATEGORY_PROJECTION,
+                    USER_SESSION_PROJECTION, USER_LOGIN_PROJECTION, USER_LIST_PROJECTION, with_counts,
+                    normalize_categories)
 
 load_dotenv()
 
-app = Flask(__name__)
-app.secret_key = os.getenv('SECRET_KEY', 'your-secret-key-here')  # Add to .env
+bp = Blueprint('main', __name__, cli_group=None)
 
-mongo_uri = os.getenv('MONGODB_URI', 'mongodb://localhost:27017/')
-client = MongoClient(mongo_uri)
-db = client[os.getenv('MONGODB_DATABASE', 'Vocabulary-finnish')]
+TEMPLATE_NAMES = ['register', 'login', 'index', 'all', 'edit', 'add', 'categories', 'statistics', 'users', 'search', 'import', 'category', 'review']
+
+def render(template, **context):
+    # The template is not called "name": pages such as category pass a name of their own in the context.
+    started = time.perf_counter()
+    try:
+        return render_template(current_app.extensions['templates'][template], **context)
+    finally:
+        timer = metrics.current_request()
+        if timer is not None:
+            timer.render_seconds += time.perf_counter() - started
+
+def stream(template, **context):
+    return stream_template(current_app.extensions['templates'][template], **context)
+
+registry = metrics.Registry()
+command_metrics = metrics.CommandMetrics(registry)
+SLOW_REQUEST_MS = float(os.getenv('SLOW_REQUEST_MS', '0'))
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+
+@bp.before_app_request
+def start_timer():
+    metrics.start_request()
+
+@bp.after_app_request
+def record_timings(response):
+    timer = metrics.finish_request()
+    if timer is None:
+        return response
+    total = time.perf_counter() - timer.started
+    endpoint = request.endpoint or 'unmatched'
+    registry.observe('http_request_duration_seconds', total, 'Time spent in the view, end to end.',
+                     endpoint=endpoint, method=request.method, status=response.status_code)
+    registry.observe('http_request_db_seconds', timer.db_seconds, 'Time spent waiting on MongoDB per request.',
+                     endpoint=endpoint)
+    registry.observe('http_request_render_seconds', timer.render_seconds, 'Time spent rendering templates per request.',
+                     endpoint=endpoint)
+    if SLOW_REQUEST_MS and total * 1000 >= SLOW_REQUEST_MS:
+        current_app.logger.warning('Slow request %s %s: %.1f ms total, %.1f ms MongoDB, %.1f ms rendering; queries: %s',
+                           request.method, request.path, total * 1000, timer.db_seconds * 1000,
+                           timer.render_seconds * 1000,
+                           '; '.join('%s %.1f ms' % (shape, seconds * 1000) for shape, seconds in timer.commands))
+    return response
+
+@bp.route('/metrics')
+def metrics_endpoint():
+    if METRICS_TOKEN and request.headers.get('Authorization') != 'Bearer ' + METRICS_TOKEN:
+        abort(401)
+    for name, value in user_cache.stats().items():
+        registry.set('user_cache_' + name, value, 'Session user cache: ' + name.replace('_', ' ') + '.')
+    for cache, cache_stats in vocabulary_cache.stats().items():
+        for name, value in cache_stats.items():
+            registry.set('vocabulary_cache_' + name, value, 'Vocabulary read cache: ' + name.replace('_', ' ') + '.',
+                         cache=cache)
+    registry.set('vocabulary_cache_invalidations', vocabulary_cache.invalidations,
+                 'Times this process dropped its cached vocabulary pages.')
+    registry.set('vocabulary_cache_change_stream', int(vocabulary_cache.mode == 'change_stream'),
+                 '1 while invalidations arrive by change stream, 0 while polling.')
+    registry.set('search_index_words', len(search_index), 'Words in this process\'s search index.')
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+indexes_ready = False
+
+@bp.before_app_request
+def bootstrap_indexes():
+    # Runs once per process, on the first request, so importing the app never waits on MongoDB.
+    global indexes_ready
+    if indexes_ready:
+        return
+    for collection, name, error in indexes.ensure_indexes(get_db()):
+        current_app.logger.warning('Could not create index %s.%s: %s', collection, name, error)
+    indexes_ready = True
+
+@bp.cli.command('check-indexes')
+def check_indexes():
+    """Create the indexes and fail if any query the app issues would scan a whole collection."""
+    missing = indexes.ensure_indexes(get_db())
+    for collection, name, error in missing:
+        click.echo('FAIL index %s.%s could not be created: %s' % (collection, name, error))
+    failures = 0
+    for name, stages, failed in indexes.check_query_plans(get_db()):
+        click.echo('%-4s %-28s %s' % ('FAIL' if failed else 'ok', name, ' > '.join(stages)))
+        failures += failed
+    if failures or missing:
+        raise click.ClickException('%d index(es) missing, %d query shape(s) use a COLLSCAN' % (len(missing), failures))
+
+def owner_for_email(email):
+    user_doc = get_db()['users'].find_one({'email': email}, {'_id': 1})
+    if user_doc is None:
+        raise click.ClickException('no user with email %s' % email)
+    return user_doc['_id']
+
+@bp.cli.command('import-vocab')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(transfer.FORMATS), help='Defaults to the file extension.')
+@click.option('--owner', 'email', required=True, help='Email of the user the words belong to.')
+def import_vocab_command(path, fmt, email):
+    """Import words from a CSV or JSONL file, updating words that already exist."""
+    owner_id = owner_for_email(email)
+    with open(path, 'rb') as f:
+        summary = import_words(f, fmt or transfer.guess_format(path), owner_id)
+    click.echo('%(processed)d rows: %(inserted)d inserted, %(updated)d updated, %(failed)d failed' % summary)
+    for error in summary['errors']:
+        click.echo('line %(line)d: %(error)s' % error, err=True)
+
+@bp.cli.command('export-vocab')
+@click.argument('path', type=click.Path(dir_okay=False, writable=True))
+@click.option('--format', 'fmt', type=click.Choice(transfer.FORMATS), help='Defaults to the file extension.')
+@click.option('--owner', 'email', help='Only export the words of the user with this email.')
+def export_vocab_command(path, fmt, email):
+    """Write every word (or one user's words) to a CSV or JSONL file."""
+    query = owned(owner_for_email(email)) if email else {}
+    cursor = get_db()['vocabulary'].find(query, transfer.EXPORT_PROJECTION).sort('_id', 1).batch_size(STREAM_BATCH_SIZE)
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        for line in transfer.export_rows(cursor, fmt or transfer.guess_format(path)):
+            f.write(line)
+
+@bp.cli.command('migrate-ownership')
+@click.option('--owner', 'email', required=True, help='Email of the user who gets every word that has no owner yet.')
+@click.option('--private', is_flag=True, help='Do not share the migrated words with other users.')
+def migrate_ownership_command(email, private):
+    """Give words created before per-user ownership to one user, shared with everyone unless --private."""
+    owner_id = owner_for_email(email)
+    for collection, name, error in indexes.ensure_indexes(get_db()):
+        click.echo('index %s.%s could not be created: %s' % (collection, name, error), err=True)
+    migrated = ownership.migrate(get_db(), owner_id, shared=not private)
+    words_bulk_written(owner_id)
+    click.echo('%d words now belong to %s%s' % (migrated, email, '' if private else ' and are shared'))
 
 login_manager = LoginManager()
-login_manager.init_app(app)
-login_manager.login_view = 'login'
+login_manager.login_view = 'main.login'
+
+PAGE_SIZE = int(os.getenv('VOCAB_PAGE_SIZE', '50'))
+MAX_PAGE_SIZE = 500
+STREAM_BATCH_SIZE = int(os.getenv('VOCAB_STREAM_BATCH_SIZE', '500'))
+STREAM_BUFFER_SIZE = 16 * 1024
+
+def page_size_arg(args=None):
+    args = request.args if args is None else args
+    try:
+        size = int(args.get('size', PAGE_SIZE))
+    except ValueError:
+        size = PAGE_SIZE
+    return max(1, min(size, MAX_PAGE_SIZE))
+
+def parse_cursor(value):
+    if value and ObjectId.is_valid(value):
+        return ObjectId(value)
+    return None
+
+def keyset_query(query, after=None, before=None):
+    # Seek on _id instead of skip() so every page costs the same no matter how deep it is.
+    query = dict(query)
+    if before is not None:
+        bound, order = {'$lt': before}, -1
+    elif after is not None:
+        bound, order = {'$gt': after}, 1
+    else:
+        return query, 1
+    if '$or' in query:
+        # Bound every branch so each one keeps seeking on its own index.
+        query['$or'] = [dict(branch, _id=bound) for branch in query['$or']]
+    else:
+        query['_id'] = bound
+    return query, order
+
+def keyset_page(collection, query, after=None, before=None, size=PAGE_SIZE, projection=None):
+    query, order = keyset_query(query, after, before)
+    cursor = collection.find(query, projection).sort('_id', order).limit(size + 1).batch_size(size + 1)
+    return keyset_result(list(cursor), after, before, size)
+
+def keyset_result(docs, after, before, size):
+    # docs holds up to size + 1 documents; the extra one only tells us whether another page exists.
+    has_more = len(docs) > size
+    docs = docs[:size]
+    if before is not None:
+        docs.reverse()
+        has_prev, has_next = has_more, True
+    else:
+        has_prev, has_next = after is not None, has_more
+    prev_cursor = str(docs[0]['_id']) if docs and has_prev else None
+    next_cursor = str(docs[-1]['_id']) if docs and has_next else None
+    return docs, prev_cursor, next_cursor
+
+def entry_page(collection, query, after=None, before=None, size=PAGE_SIZE):
+    docs, prev_cursor, next_cursor = keyset_page(collection, query, after, before, size, VOCAB_PROJECTION)
+    return [VocabEntry.from_doc(doc) for doc in docs], prev_cursor, next_cursor
+
+def entry_or_none(doc):
+    return VocabEntry.from_doc(doc) if doc is not None else None
+
+def buffered(chunks, size=STREAM_BUFFER_SIZE):
+    # Jinja yields many tiny strings; join them so each socket write carries a useful amount of HTML.
+    buf, length = [], 0
+    for chunk in chunks:
+        buf.append(chunk)
+        length += len(chunk)
+        if length >= size:
+            yield ''.join(buf)
+            buf, length = [], 0
+    if buf:
+        yield ''.join(buf)
+
+# Session users are served from memory; call invalidate_user() whenever a user's document changes.
+user_cache = TTLCache(int(os.getenv('USER_CACHE_SIZE', '1024')), float(os.getenv('USER_CACHE_TTL', '60')))
+
+def invalidate_user(user_id):
+    user_cache.pop(str(user_id))
+
+def remember_user(user):
+    user_cache.set(user.id, user)
+    return user
+
+search_index = SearchIndex()
+SEARCH_LIMIT = 20
+MAX_SEARCH_LIMIT = 100
+
+# Word pages and category lists read through this; other workers learn about writes via change stream or polling.
+def vocabulary_changed(change):
+    # Keeps this worker's search index in step with writes made by other workers. Change events (from the
+    # stream, or made up by polling for what it read) carry the word; anything else drops the index so the next
+    # search rebuilds it.
+    if change is not None and change.get('operationType') == 'delete':
+        search_index.remove(change['documentKey']['_id'])
+    elif change is not None and change.get('fullDocument'):
+        search_index.add(change['fullDocument'])
+    else:
+        search_index.invalidate()
+
+vocabulary_cache = VocabularyCache(int(os.getenv('VOCAB_CACHE_SIZE', '2048')), float(os.getenv('VOCAB_CACHE_TTL', '300')),
+                                   float(os.getenv('VOCAB_CACHE_POLL_SECONDS', '2')),
+                                   category_ttl=float(os.getenv('CATEGORY_CACHE_TTL', '60')),
+                                   on_change=vocabulary_changed)
+
+def current_owner():
+    return ObjectId(current_user.id)
+
+def cached_reads():
+    vocabulary_cache.ensure_watching(get_db)
+    return vocabulary_cache
+
+def touch_vocabulary():
+    # A version counter the API turns into ETags, so unchanged data can be answered without a query.
+    # Other workers' caches poll it too when no change stream is available.
+    doc = get_db()['meta'].find_one_and_update({'_id': 'vocabulary'},
+                                               {'$inc': {'version': 1}, '$set': {'updatedAt': datetime.now(timezone.utc)}},
+                                               projection={'version': 1}, upsert=True,
+                                               return_document=ReturnDocument.AFTER)
+    vocabulary_cache.wrote(doc['version'])
+
+def vocabulary_version():
+    doc = get_db()['meta'].find_one({'_id': 'vocabulary'}) or {}
+    return doc.get('version', 0), doc.get('updatedAt')
+
+# What word_written() needs to know about a word before it is changed.
+WRITE_FIELDS = dict(stats.STATS_FIELDS, **ownership.OWNER_FIELDS)
+
+def word_written(id, before=None, after=None):
+    words_written([(id, before, after)])
+
+def words_written(changes):
+    # (id, before, after) per written word; keeps everything derived from the vocabulary collection in step.
+    stats.record_changes(get_db(), [(before, after) for _, before, after in changes])
+    now = datetime.now(timezone.utc)
+    tombstones = []
+    for id, before, after in changes:
+        was_shared, is_shared = bool(before and before.get('shared')), bool(after and after.get('shared'))
+        # Only the owner's cached pages, or everybody's while the word is or was shared.
+        vocabulary_cache.invalidate_word(id, (before or after).get('ownerId'), was_shared or is_shared)
+        if after is None:
+            search_index.remove(id)
+            # Tombstones let API clients syncing with ?since= learn about deletions.
+            tombstones.append(ReplaceOne({'_id': id}, ownership.tombstone(id, before, now), upsert=True))
+            continue
+        search_index.add(dict(after, _id=id))
+        if was_shared and not is_shared:
+            # Other users' synced copies of a word that is no longer shared have to go.
+            tombstones.append(ReplaceOne({'_id': id}, ownership.tombstone(id, before, now, unshared=True), upsert=True))
+        elif is_shared and not was_shared and before is not None:
+            tombstones.append(DeleteOne({'_id': id}))
+    if tombstones:
+        get_db()['deleted_words'].bulk_write(tombstones, ordered=False)
+    touch_vocabulary()
+
+def all_categories():
+    return cached_reads().category_list('all', lambda: [
+        Category.from_doc(doc) for doc in get_db()['categories'].find({}, CATEGORY_PROJECTION)])
+
+def canonical_categories():
+    return cached_reads().category_list('names', lambda: {cat.name.casefold(): cat.name for cat in all_categories() if cat.name})
+
+def form_categories():
+    return normalize_categories(request.form['categories'].split(','), canonical_categories())
+
+def words_bulk_written(owner_id):
+    # After imports the cheapest correct thing is to recount once and let the search index rebuild lazily.
+    stats.recompute(get_db(), owner_id)
+    stats.recompute(get_db(), stats.SHARED)
+    search_index.invalidate()
+    vocabulary_cache.invalidate()
+    touch_vocabulary()
+
+def bulk_edit(owner_id, ids, action, value=''):
+    # One read to learn what changes, then a single delete_many/update_many for all words. Only the owner's
+    # words are touched; other ids in the request count as not found.
+    value = ' '.join(value.split())
+    if action in ('add_category', 'remove_category'):
+        if not value:
+            raise ValueError('a category is required')
+        value = normalize_categories([value], canonical_categories())[0]
+    elif action == 'set_part_of_speech' and not value:
+        raise ValueError('a part of speech is required')
+    elif action not in bulk.ACTIONS:
+        raise ValueError('unknown action: %s' % action)
+    docs = list(get_db()['vocabulary'].find(owned(owner_id, {'_id': {'$in': ids}}), bulk.BULK_FIELDS))
+    if action == 'delete':
+        changes = [(doc['_id'], doc, None) for doc in docs]
+        if changes:
+            get_db()['vocabulary'].delete_many({'_id': {'$in': [doc['_id'] for doc in docs]}})
+    else:
+        update, transform = bulk.update_for(action, value, datetime.now(timezone.utc))
+        changes = [(doc['_id'], doc, after) for doc in docs for after in [transform(doc)] if after is not None]
+        if changes:
+            get_db()['vocabulary'].update_many({'_id': {'$in': [id for id, _, _ in changes]}}, update)
+    if changes:
+        words_written(changes)
+    return {'action': action, 'requested': len(ids), 'found': len(docs), 'changed': len(changes)}
+
+def import_words(stream, fmt, owner_id):
+    canonical = canonical_categories()
+
+    def rows():
+        for line, doc in transfer.iter_rows(stream, fmt):
+            if isinstance(doc, dict):
+                doc['categories'] = normalize_categories(doc['categories'], canonical)
+            yield line, doc
+
+    summary = transfer.import_rows(get_db()['vocabulary'], rows(), owner_id)
+    if summary['inserted'] or summary['updated']:
+        words_bulk_written(owner_id)
+    return summary
+
+def ensure_search_index():
+    # Polls (or starts the change stream) first, so other workers' writes reach the index before it is read.
+    cached_reads()
+    search_index.ensure_built(lambda: get_db()['vocabulary'].find({}, SEARCH_FIELDS).batch_size(STREAM_BATCH_SIZE))
 
-class User(UserMixin):
-    def __init__(self, user_doc):
-        self.id = str(user_doc['_id'])
-        self.name = user_doc.get('name', '')
-        self.email = user_doc.get('email', '')
+def search_words(query, limit=SEARCH_LIMIT):
+    ensure_search_index()
+    return search_index.search(query, limit, owner=current_user.id)
+
+def lookup_words(words, owner_id):
+    # One $in over the Finnish collation index for the whole batch. Words it misses get a second chance in the
+    # in-memory search index, which also ignores diacritics ('paiva' -> 'päivä').
+    results = {word: [] for word in words}
+    cursor = get_db()['vocabulary'].find(visible(owner_id, {'word': {'$in': words}}), api.LOOKUP_PROJECTION,
+                                         collation=indexes.FINNISH).batch_size(len(words) + 1)
+    for doc in cursor:
+        key = api.normalize_word(doc.get('word', ''))
+        if key in results:
+            results[key].append(api.lookup_json(doc, 'exact'))
+    missing = [word for word, found in results.items() if not found]
+    if missing:
+        ensure_search_index()
+        for word in missing:
+            results[word] = [api.lookup_json(dict(item, _id=item['id']), 'folded')
+                             for item in search_index.words(word, owner=str(owner_id))]
+    return results
+
+hasher = PasswordHasher()
+login_throttle = LoginThrottle(int(os.getenv('LOGIN_ATTEMPTS_PER_MINUTE', '10')), 60)
+
+def busy():
+    return 'Server busy, please try again in a moment', 503, {'Retry-After': '1'}
 
 @login_manager.user_loader
 def load_user(user_id):
-    user_doc = db['users'].find_one({'_id': ObjectId(user_id)})
+    user = user_cache.get(user_id)
+    if user is not None:
+        return user
+    user_doc = get_db()['users'].find_one({'_id': ObjectId(user_id)}, USER_SESSION_PROJECTION)
     if user_doc:
-        return User(user_doc)
+        return remember_user(User(user_doc))
     return None
 
-@app.route('/register', methods=['GET', 'POST'])
+@bp.route('/register', methods=['GET', 'POST'])
 def register():
     if request.method == 'POST':
         name = request.form['name']
         email = request.form['email']
         password = request.form['password']
-        if db['users'].find_one({'email': email}):
+        if get_db()['users'].find_one({'email': email}, {'_id': 1}):
             return 'User already exists'
-        hashed_password = generate_password_hash(password)
-        user_id = db['users'].insert_one({
+        try:
+            hashed_password = hasher.hash(password)
+        except HashingBusy:
+            return busy()
+        user_doc = {
             'name': name,
             'email': email,
             'password': hashed_password
-        }).inserted_id
-        user = User(db['users'].find_one({'_id': user_id}))
+        }
+        try:
+            user_id = get_db()['users'].insert_one(user_doc).inserted_id
+        except DuplicateKeyError:
+            return 'User already exists'
+        invalidate_user(user_id)
+        user = remember_user(User(user_doc))
         login_user(user)
         return redirect('/')
-    return render_template_string('''
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <title>Register</title>
-        <style>
-            body { 
-                font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; 
-                background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); 
-                display: flex; 
-                justify-content: center; 
-                align-items: center; 
-                height: 100vh; 
-                margin: 0; 
-                color: #333; 
-            }
-            .container { 
-                background: white; 
-                padding: 40px; 
-                border-radius: 15px; 
-                box-shadow: 0 10px 30px rgba(0,0,0,0.2); 
-                max-width: 400px; 
-                width: 100%; 
-                text-align: center; 
-            }
-            h1 { 
-                margin-bottom: 30px; 
-                color: #4CAF50; 
-                font-size: 28px; 
-                font-weight: 300; 
-            }
-            form { 
-                display: flex; 
-                flex-direction: column; 
-            }
-            label { 
-                text-align: left; 
-                margin-bottom: 8px; 
-                font-weight: 600; 
-                color: #555; 
-            }
-            input[type="text"], input[type="password"] { 
-                padding: 12px; 
-                margin-bottom: 20px; 
-                border: 2px solid #e0e0e0; 
-                border-radius: 8px; 
-                width: 100%; 
-                font-size: 16px; 
-                transition: border-color 0.3s; 
-            }
-            input[type="text"]:focus, input[type="password"]:focus { 
-                border-color: #4CAF50; 
-                outline: none; 
-            }
-            input[type="submit"] { 
-                background: #4CAF50; 
-                color: white; 
-                padding: 12px; 
-                border: none; 
-                border-radius: 8px; 
-                cursor: pointer; 
-                font-size: 16px; 
-                font-weight: 600; 
-                transition: background 0.3s; 
-                width: 100%; 
-            }
-            input[type="submit"]:hover { 
-                background: #45a049; 
-                transform: translateY(-2px); 
-                box-shadow: 0 4px 12px rgba(76, 175, 80, 0.3); 
-            }
-            p { 
-                margin-top: 20px; 
-                font-size: 14px; 
-            }
-            a { 
-                color: #667eea; 
-                text-decoration: none; 
-                font-weight: 600; 
-            }
-            a:hover { 
-                text-decoration: underline; 
-            }
-        </style>
-    </head>
-    <body>
-        <div class="container">
-            <h1>Register</h1>
-            <form method="post">
-                <label>Name: <input type="text" name="name" required></label>
-                <label>Email: <input type="text" name="email" required></label>
-                <label>Password: <input type="password" name="password" required></label>
-                <input type="submit" value="Register">
-            </form>
-            <p>Already have an account? <a href="/login">Login</a></p>
-        </div>
-    </body>
-    </html>
-    ''')
-
-@app.route('/login', methods=['GET', 'POST'])
+    return render('register')
+
+@bp.route('/login', methods=['GET', 'POST'])
 def login():
     if request.method == 'POST':
+        if not login_throttle.allow(request.remote_addr):
+            return 'Too many login attempts, please wait a minute', 429, {'Retry-After': '60'}
         email = request.form['email']
         password = request.form['password']
-        user_doc = db['users'].find_one({'email': email})
-        if user_doc and check_password_hash(user_doc['password'], password):
-            user = User(user_doc)
+        user_doc = get_db()['users'].find_one({'email': email}, USER_LOGIN_PROJECTION)
+        try:
+            valid = user_doc is not None and hasher.check(user_doc['password'], password)
+        except HashingBusy:
+            return busy()
+        if valid:
+            try:
+                if hasher.needs_rehash(user_doc['password']):
+                    # Hash parameters changed since this password was stored; upgrade it while we have the plaintext.
+                    get_db()['users'].update_one({'_id': user_doc['_id']},
+                                                 {'$set': {'password': hasher.hash(password)}})
+            except HashingBusy:
+                # The upgrade is best-effort: the password was right, so log in and try again next time.
+                pass
+            user = remember_user(User(user_doc))
             login_user(user)
             return redirect('/')
         return 'Invalid credentials'
-    return render_template_string('''
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <title>Login</title>
-        <style>
-            body { 
-                font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; 
-                background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); 
-                display: flex; 
-                justify-content: center; 
-                align-items: center; 
-                height: 100vh; 
-                margin: 0; 
-                color: #333; 
-            }
-            .container { 
-                background: white; 
-                padding: 40px; 
-                border-radius: 15px; 
-                box-shadow: 0 10px 30px rgba(0,0,0,0.2); 
-                max-width: 400px; 
-                width: 100%; 
-                text-align: center; 
-            }
-            h1 { 
-                margin-bottom: 30px; 
-                color: #4CAF50; 
-                font-size: 28px; 
-                font-weight: 300; 
-            }
-            form { 
-                display: flex; 
-                flex-direction: column; 
-            }
-            label { 
-                text-align: left; 
-                margin-bottom: 8px; 
-                font-weight: 600; 
-                color: #555; 
-            }
-            input[type="text"], input[type="password"] { 
-                padding: 12px; 
-                margin-bottom: 20px; 
-                border: 2px solid #e0e0e0; 
-                border-radius: 8px; 
-                width: 100%; 
-                font-size: 16px; 
-                transition: border-color 0.3s; 
-            }
-            input[type="text"]:focus, input[type="password"]:focus { 
-                border-color: #4CAF50; 
-                outline: none; 
-            }
-            input[type="submit"] { 
-                background: #4CAF50; 
-                color: white; 
-                padding: 12px; 
-                border: none; 
-                border-radius: 8px; 
-                cursor: pointer; 
-                font-size: 16px; 
-                font-weight: 600; 
-                transition: background 0.3s; 
-                width: 100%; 
-            }
-            input[type="submit"]:hover { 
-                background: #45a049; 
-                transform: translateY(-2px); 
-                box-shadow: 0 4px 12px rgba(76, 175, 80, 0.3); 
-            }
-            p { 
-                margin-top: 20px; 
-                font-size: 14px; 
-            }
-            a { 
-                color: #667eea; 
-                text-decoration: none; 
-                font-weight: 600; 
-            }
-            a:hover { 
-                text-decoration: underline; 
-            }
-        </style>
-    </head>
-    <body>
-        <div class="container">
-            <h1>Login</h1>
-            <form method="post">
-                <label>Email: <input type="text" name="email" required></label>
-                <label>Password: <input type="password" name="password" required></label>
-                <input type="submit" value="Login">
-            </form>
-            <p>Don't have an account? <a href="/register">Register</a></p>
-        </div>
-    </body>
-    </html>
-    ''')
-
-@app.route('/logout')
+    return render('login')
+
+@bp.route('/logout')
 @login_required
 def logout():
+    invalidate_user(current_user.id)
     logout_user()
     return redirect('/')
 
-@app.route('/')
+@bp.route('/')
 @login_required
 def index():
-    docs = list(db['vocabulary'].find())
-    return render_template_string('''
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <title>Vocabulary Words</title>
-        <style>
-            body { font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; background-color: #f4f4f4; margin: 0; padding: 20px; }
-            .container { background: white; padding: 30px; border-radius: 10px; box-shadow: 0 4px 8px rgba(0,0,0,0.1); max-width: 600px; margin: 0 auto; }
-            h1 { text-align: center; color: #333; }
-            ul { list-style-type: none; padding: 0; }
-            li { background: #f9f9f9; margin: 10px 0; padding: 15px; border-radius: 5px; border-left: 5px solid #4CAF50; position: relative; }
-            .actions { position: absolute; top: 50%; right: 15px; transform: translateY(-50%); }
-            .actions a { margin-left: 10px; }
-            strong { color: #555; }
-            a { color: #4CAF50; text-decoration: none; font-weight: bold; }
-            a:hover { text-decoration: underline; }
-            .nav-bar { display: flex; justify-content: center; gap: 20px; margin-top: 20px; }
-            .add-link { background: #4CAF50; color: white; padding: 10px 20px; border-radius: 5px; text-decoration: none; }
-            .add-link:hover { background: #45a049; }
-            .user-info { text-align: center; margin-bottom: 20px; }
-        </style>
-    </head>
-    <body>
-        <div class="container">
-            <div class="user-info">
-                <p>Welcome, {{ current_user.name }}! <a href="/logout">Logout</a></p>
-            </div>
-            <h1>Vocabulary Words</h1>
-            <ul>
-            {% for doc in docs %}
-                <li>
-                    <strong>Word:</strong> {{ doc.word }}<br>
-                    <strong>Translation:</strong> {{ doc.get('translation', 'N/A') }}<br>
-                    <strong>Part of Speech:</strong> {{ doc.get('partOfSpeech', doc.get('part_of_speech', 'N/A')) }}<br>
-                    <strong>Examples:</strong> {{ doc.get('examples', []) | join(', ') }}<br>
-                    <strong>Categories:</strong> {{ doc.get('categories', []) | join(', ') }}
-                    <div class="actions">
-                        <a href="/edit/{{ doc['_id'] }}">Edit</a>
-                        <a href="/delete/{{ doc['_id'] }}" style="color: red;">Delete</a>
-                    </div>
-                </li>
-            {% endfor %}
-            </ul>
-            <div class="nav-bar">
-                <a href="/add" class="add-link">Add New Word</a>
-                <a href="/categories" class="add-link" style="background: #2196F3;">View Categories</a>
-                <a href="/statistics" class="add-link" style="background: #FF9800;">View Statistics</a>
-            </div>
-        </div>
-    </body>
-    </html>
-    ''', docs=docs)
-
-@app.route('/edit/<id>', methods=['GET', 'POST'])
+    size = page_size_arg()
+    after, before = parse_cursor(request.args.get('after')), parse_cursor(request.args.get('before'))
+    entries, prev_cursor, next_cursor = cached_reads().page(
+        current_user.id, ('index', current_user.id, after, before, size),
+        lambda: entry_page(get_db()['vocabulary'], visible(current_owner()), after=after, before=before, size=size))
+    return render('index', entries=entries, prev_cursor=prev_cursor, next_cursor=next_cursor, size=size)
+
+@bp.route('/all')
+@login_required
+def all_words():
+    # The cursor is consumed lazily by the template, so documents are pulled one batch at a time while rendering.
+    cursor = get_db()['vocabulary'].find(visible(current_owner()), VOCAB_PROJECTION).sort('_id', 1).batch_size(
+        STREAM_BATCH_SIZE)
+    entries = (VocabEntry.from_doc(doc) for doc in cursor)
+    return Response(buffered(stream('all', entries=entries)), mimetype='text/html')
+
+@bp.route('/edit/<id>', methods=['GET', 'POST'])
 @login_required
 def edit_word(id):
     from bson import ObjectId
     if request.method == 'POST':
-        db['vocabulary'].update_one({'_id': ObjectId(id)}, {'$set': {
+        fields = {
             'word': request.form['word'],
             'translation': request.form['translation'],
             'partOfSpeech': request.form['partOfSpeech'],
             'examples': [e.strip() for e in request.form['examples'].split(',') if e.strip()],
-            'categories': [c.strip() for c in request.form['categories'].split(',') if c.strip()]
-        }})
+            'categories': form_categories(),
+            'shared': 'shared' in request.form,
+            'updatedAt': datetime.now(timezone.utc)
+        }
+        before = get_db()['vocabulary'].find_one_and_update(owned(current_owner(), {'_id': ObjectId(id)}),
+                                                            {'$set': fields}, projection=WRITE_FIELDS,
+                                                            return_document=ReturnDocument.BEFORE)
+        if before is not None:
+            word_written(ObjectId(id), before, dict(fields, ownerId=before['ownerId']))
         return redirect('/')
-    doc = db['vocabulary'].find_one({'_id': ObjectId(id)})
-    return render_template_string('''
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <title>Edit Word</title>
-        <style>
-            body { font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; background-color: #f4f4f4; margin: 0; padding: 20px; }
-            .container { background: white; padding: 30px; border-radius: 10px; box-shadow: 0 4px 8px rgba(0,0,0,0.1); max-width: 600px; margin: 0 auto; }
-            h1 { text-align: center; color: #333; }
-            form { display: flex; flex-direction: column; }
-            label { display: block; margin-bottom: 5px; font-weight: bold; }
-            input[type="text"] { padding: 10px; margin-bottom: 15px; border: 1px solid #ddd; border-radius: 5px; width: 100%; }
-            input[type="submit"] { background: #4CAF50; color: white; padding: 10px; border: none; border-radius: 5px; cursor: pointer; width: 100%; font-size: 16px; }
-            input[type="submit"]:hover { background: #45a049; }
-            .back-link { display: block; text-align: center; margin-top: 20px; background: #4CAF50; color: white; padding: 10px; border-radius: 5px; text-decoration: none; font-size: 16px; }
-            .back-link:hover { background: #45a049; }
-        </style>
-    </head>
-    <body>
-        <div class="container">
-            <h1>Edit Word</h1>
-            <form method="post">
-                <label>Word: <input type="text" name="word" value="{{ doc.word }}" required></label>
-                <label>Translation: <input type="text" name="translation" value="{{ doc.translation }}" required></label>
-                <label>Part of Speech: <input type="text" name="partOfSpeech" value="{{ doc.partOfSpeech }}" required></label>
-                <label>Examples: <input type="text" name="examples" value="{{ doc.get('examples', []) | join(', ') }}"></label>
-                <label>Categories: <input type="text" name="categories" value="{{ doc.get('categories', []) | join(', ') }}"></label>
-                <input type="submit" value="Update">
-            </form>
-            <a href="/" class="back-link">Back to Home</a>
-        </div>
-    </body>
-    </html>
-    ''', doc=doc)
-
-@app.route('/delete/<id>')
+    entry = cached_reads().word(ObjectId(id), lambda: entry_or_none(
+        get_db()['vocabulary'].find_one({'_id': ObjectId(id)}, VOCAB_PROJECTION)))
+    # Shared words of other users can be read but not edited.
+    if entry is None or entry.owner_id != current_user.id:
+        abort(404)
+    return render('edit', entry=entry)
+
+@bp.route('/delete/<id>')
 @login_required
 def delete_word(id):
     from bson import ObjectId
-    db['vocabulary'].delete_one({'_id': ObjectId(id)})
+    before = get_db()['vocabulary'].find_one_and_delete(owned(current_owner(), {'_id': ObjectId(id)}),
+                                                        projection=WRITE_FIELDS)
+    if before is not None:
+        word_written(ObjectId(id), before=before)
     return redirect('/')
 
-@app.route('/categories')
+@bp.route('/search')
+@login_required
+def search():
+    query = request.args.get('q', '')
+    results = search_words(query) if query.strip() else []
+    return render('search', query=query, results=results)
+
+@bp.route('/api/search')
+@login_required
+def api_search():
+    try:
+        limit = max(1, min(int(request.args.get('limit', SEARCH_LIMIT)), MAX_SEARCH_LIMIT))
+    except ValueError:
+        limit = SEARCH_LIMIT
+    query = request.args.get('q', '')
+    return jsonify(query=query, results=search_words(query, limit) if query.strip() else [])
+
+@bp.route('/import', methods=['GET', 'POST'])
+@login_required
+def import_vocabulary():
+    if request.method == 'POST':
+        upload = request.files.get('file')
+        if upload is None or not upload.filename:
+            return render('import', error='Choose a file to import')
+        fmt = request.form.get('format') or transfer.guess_format(upload.filename)
+        if fmt not in transfer.FORMATS:
+            return render('import', error='Unsupported format: %s' % fmt)
+        summary = import_words(upload.stream, fmt, current_owner())
+        if request.accept_mimetypes.best == 'application/json':
+            return jsonify(summary)
+        return render('import', summary=summary)
+    return render('import')
+
+@bp.route('/export')
+@login_required
+def export_vocabulary():
+    fmt = request.args.get('format', 'jsonl')
+    if fmt not in transfer.FORMATS:
+        abort(400)
+    cursor = get_db()['vocabulary'].find(owned(current_owner()), transfer.EXPORT_PROJECTION).sort('_id', 1).batch_size(
+        STREAM_BATCH_SIZE)
+    mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    return Response(stream_with_context(buffered(transfer.export_rows(cursor, fmt))), mimetype=mimetype,
+                    headers={'Content-Disposition': 'attachment; filename=vocabulary.%s' % fmt})
+
+@bp.after_app_request
+def compress_api_responses(response):
+    if request.path.startswith('/api/'):
+        return api.compress(response, request.accept_encodings)
+    return response
+
+def api_error(message, status=400):
+    response = jsonify(error=message)
+    response.status_code = status
+    return response
+
+def api_cache_headers(response, etag, last_modified=None):
+    response.set_etag(etag, weak=True)
+    response.last_modified = last_modified
+    response.cache_control.no_cache = True
+    return response
+
+@bp.route('/api/v1/vocabulary')
+@login_required
+def api_vocabulary():
+    try:
+        fields, projection = api.parse_fields(request.args.get('fields'))
+        since = api.parse_since(request.args['since']) if request.args.get('since') else None
+    except ValueError as e:
+        return api_error(str(e))
+    version, last_modified = vocabulary_version()
+    etag = hashlib.md5(('%s:%s?%s' % (version, current_user.id, request.query_string.decode())).encode()).hexdigest()
+    if not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        return api_cache_headers(Response(status=304), etag, last_modified)
+    synced_at = datetime.now(timezone.utc)
+    after = parse_cursor(request.args.get('after'))
+    query = visible(current_owner(), {'updatedAt': {'$gt': since}} if since else {})
+    docs, _, next_cursor = keyset_page(get_db()['vocabulary'], query, after=after, size=page_size_arg(), projection=projection)
+    body = {'items': [api.word_json(doc, fields) for doc in docs], 'next': next_cursor, 'syncedAt': api.isoformat(synced_at)}
+    if since and after is None:
+        deleted = get_db()['deleted_words'].find(
+            ownership.visible_tombstones(current_owner(), {'deletedAt': {'$gt': since}}), {'_id': 1})
+        body['deleted'] = [str(doc['_id']) for doc in deleted]
+    return api_cache_headers(jsonify(body), etag, last_modified)
+
+@bp.route('/api/v1/vocabulary/<id>')
+@login_required
+def api_word(id):
+    try:
+        fields, projection = api.parse_fields(request.args.get('fields'))
+    except ValueError as e:
+        return api_error(str(e))
+    doc = None
+    if ObjectId.is_valid(id):
+        doc = get_db()['vocabulary'].find_one(visible(current_owner(), {'_id': ObjectId(id)}), projection)
+    if doc is None:
+        return api_error('word not found', 404)
+    response = jsonify(api.word_json(doc, fields))
+    response.add_etag(weak=True)
+    response.last_modified = doc.get('updatedAt')
+    return response.make_conditional(request)
+
+@bp.route('/api/v1/categories')
+@login_required
+def api_categories():
+    # Small collection without timestamps: build the body and let the content hash decide on a 304.
+    cats = [{'name': cat.name, 'description': cat.description} for cat in all_categories()]
+    response = jsonify(items=cats)
+    response.add_etag(weak=True)
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+@bp.route('/api/v1/lookup', methods=['POST'])
+@login_required
+def api_lookup():
+    try:
+        words = api.parse_lookup(request.get_json(silent=True))
+    except ValueError as e:
+        return api_error(str(e))
+    results = lookup_words(words, current_owner()) if words else {}
+    return jsonify(results=results, missing=[word for word, found in results.items() if not found])
+
+@bp.route('/bulk', methods=['POST'])
+@login_required
+def bulk_words():
+    try:
+        summary = bulk_edit(current_owner(), bulk.parse_ids(request.form.getlist('ids')), request.form.get('action', ''),
+                            request.form.get('value', ''))
+    except ValueError as e:
+        flash(str(e))
+    else:
+        flash('%(action)s: %(changed)d of %(requested)d selected words changed' % summary)
+    return redirect(request.referrer or url_for('main.index'))
+
+@bp.route('/api/v1/vocabulary/bulk', methods=['POST'])
+@login_required
+def api_bulk():
+    payload = request.get_json(silent=True) or {}
+    if not isinstance(payload.get('ids'), list):
+        return api_error('ids must be a list of word ids')
+    if not isinstance(payload.get('value', ''), str):
+        return api_error('value must be a string')
+    try:
+        summary = bulk_edit(current_owner(), bulk.parse_ids(payload['ids']), payload.get('action', ''),
+                            payload.get('value', ''))
+    except ValueError as e:
+        return api_error(str(e))
+    return jsonify(summary)
+
+@bp.route('/review', methods=['GET', 'POST'])
+@login_required
+def review_words():
+    user_id = ObjectId(current_user.id)
+    now = datetime.now(timezone.utc)
+    if request.method == 'POST':
+        grades = dict(review.GRADES)
+        answers = {}
+        for key, value in request.form.items():
+            word_id = key[len('grade-'):]
+            if key.startswith('grade-') and ObjectId.is_valid(word_id) and value in grades:
+                answers[ObjectId(word_id)] = grades[value]
+        shown_new = [ObjectId(id) for id in request.form.getlist('new') if ObjectId.is_valid(id)]
+        review.record_answers(get_db(), user_id, answers, shown_new, now)
+        return redirect(url_for('main.review_words'))
+    return render('review', cards=review.next_batch(get_db(), user_id, now), due=review.due_count(get_db(), user_id, now),
+                  grades=[name for name, _ in review.GRADES])
+
+@bp.route('/categories')
 @login_required
 def categories():
-    cats = list(db['categories'].find())
-    return render_template_string('''
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <title>Categories</title>
-        <style>
-            body { font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; background-color: #f4f4f4; margin: 0; padding: 20px; }
-            .container { background: white; padding: 30px; border-radius: 10px; box-shadow: 0 4px 8px rgba(0,0,0,0.1); max-width: 600px; margin: 0 auto; }
-            h1 { text-align: center; color: #333; }
-            ul { list-style-type: none; padding: 0; }
-            li { background: #f9f9f9; margin: 10px 0; padding: 10px; border-radius: 5px; border-left: 5px solid #2196F3; }
-            a { color: #2196F3; text-decoration: none; font-weight: bold; }
-            a:hover { text-decoration: underline; }
-            .back-link { display: block; text-align: center; margin-top: 20px; background: #2196F3; color: white; padding: 10px; border-radius: 5px; }
-        </style>
-    </head>
-    <body>
-        <div class="container">
-            <h1>Categories</h1>
-            <ul>
-            {% for cat in cats %}
-                <li>{% set name = cat.get('name', '') %}{% set desc = cat.get('description', '') %}{% if name %}{{ name }}{% if desc %} - {{ desc }}{% endif %}{% endif %}</li>
-            {% endfor %}
-            </ul>
-            <a href="/" class="back-link">Back to Vocabulary</a>
-        </div>
-    </body>
-    </html>
-    ''', cats=cats)
-
-@app.route('/statistics')
+    cats = [Category(cat.name, cat.description) for cat in all_categories()]
+    # Counts come from the materialized statistics documents (the user's and the shared one), not from an
+    # aggregation per page view, and match what each category page lists.
+    counts = stats.get_category_counts(get_db(), current_owner())
+    return render('categories', cats=with_counts(cats, counts))
+
+@bp.route('/categories/<path:name>')
+@login_required
+def category(name):
+    # Links may differ in case from the stored spelling; membership queries need the exact one.
+    name = canonical_categories().get(name.casefold(), name)
+    size = page_size_arg()
+    after, before = parse_cursor(request.args.get('after')), parse_cursor(request.args.get('before'))
+    entries, prev_cursor, next_cursor = cached_reads().page(
+        current_user.id, ('category', current_user.id, name, after, before, size),
+        lambda: entry_page(get_db()['vocabulary'], visible(current_owner(), {'categories': name}),
+                           after=after, before=before, size=size))
+    description = next((cat.description for cat in all_categories() if cat.name == name), '')
+    return render('category', name=name, description=description, entries=entries,
+                  prev_cursor=prev_cursor, next_cursor=next_cursor, size=size)
+
+@bp.route('/statistics')
 @login_required
 def statistics():
-    total_vocab = db['vocabulary'].count_documents({})
-    total_categories = db['categories'].count_documents({})
-    total_users = db['users'].count_documents({})
-    # Perhaps more stats, like average words per category, etc.
-    return render_template_string('''
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <title>Statistics</title>
-        <style>
-            body { font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; background-color: #f4f4f4; margin: 0; padding: 20px; }
-            .container { background: white; padding: 30px; border-radius: 10px; box-shadow: 0 4px 8px rgba(0,0,0,0.1); max-width: 600px; margin: 0 auto; }
-            h1 { text-align: center; color: #333; }
-            .stat { background: #f9f9f9; margin: 10px 0; padding: 15px; border-radius: 5px; border-left: 5px solid #FF9800; }
-            .stat strong { color: #555; }
-            a { color: #FF9800; text-decoration: none; font-weight: bold; }
-            a:hover { text-decoration: underline; }
-            .back-link { display: block; text-align: center; margin-top: 20px; background: #FF9800; color: white; padding: 10px; border-radius: 5px; }
-        </style>
-    </head>
-    <body>
-        <div class="container">
-            <h1>Statistics</h1>
-            <div class="stat">
-                <strong>Total Vocabulary Words:</strong> {{ total_vocab }}
-            </div>
-            <div class="stat">
-                <strong>Total Categories:</strong> {{ total_categories }}
-            </div>
-            <div class="stat">
-                <strong>Total Users:</strong> {{ total_users }}
-            </div>
-            <a href="/" class="back-link">Back to Vocabulary</a>
-        </div>
-    </body>
-    </html>
-    ''', total_vocab=total_vocab, total_categories=total_categories, total_users=total_users)
-
-@app.route('/users')
+    word_stats = stats.get_stats(get_db(), current_owner(), refresh=request.args.get('refresh') == '1')
+    # Collection metadata counts; no scan needed for these two.
+    total_categories = get_db()['categories'].estimated_document_count()
+    total_users = get_db()['users'].estimated_document_count()
+    return render('statistics', total_vocab=word_stats['total'], total_categories=total_categories,
+                  total_users=total_users, by_category=word_stats['by_category'],
+                  by_part_of_speech=word_stats['by_part_of_speech'], computed_at=word_stats['computed_at'])
+
+@bp.route('/users')
 @login_required
 def users():
-    users_list = list(db['users'].find())
-    return render_template_string('''
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <title>Users</title>
-        <style>
-            body { font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; background-color: #f4f4f4; margin: 0; padding: 20px; }
-            .container { background: white; padding: 30px; border-radius: 10px; box-shadow: 0 4px 8px rgba(0,0,0,0.1); max-width: 600px; margin: 0 auto; }
-            h1 { text-align: center; color: #333; }
-            ul { list-style-type: none; padding: 0; }
-            li { background: #f9f9f9; margin: 10px 0; padding: 10px; border-radius: 5px; border-left: 5px solid #9C27B0; }
-            a { color: #9C27B0; text-decoration: none; font-weight: bold; }
-            a:hover { text-decoration: underline; }
-            .back-link { display: block; text-align: center; margin-top: 20px; background: #9C27B0; color: white; padding: 10px; border-radius: 5px; }
-        </style>
-    </head>
-    <body>
-        <div class="container">
-            <h1>Users</h1>
-            <ul>
-            {% for user in users_list %}
-                <li>{% set name = user.get('name', '') %}{% set email = user.get('email', '') %}{% if name %}{{ name }}{% if email %} - {{ email }}{% endif %}{% endif %}</li>
-            {% endfor %}
-            </ul>
-            <a href="/" class="back-link">Back to Vocabulary</a>
-        </div>
-    </body>
-    </html>
-    ''', users_list=users_list)
-
-@app.route('/add', methods=['GET', 'POST'])
+    users_list = [UserSummary.from_doc(doc) for doc in get_db()['users'].find({}, USER_LIST_PROJECTION)]
+    return render('users', users_list=users_list)
+
+@bp.route('/add', methods=['GET', 'POST'])
 @login_required
 def add_word():
     if request.method == 'POST':
-        db['vocabulary'].insert_one({
+        doc = {
             'word': request.form['word'],
             'translation': request.form['translation'],
             'partOfSpeech': request.form['partOfSpeech'],
             'examples': [e.strip() for e in request.form['examples'].split(',') if e.strip()],
-            'categories': [c.strip() for c in request.form['categories'].split(',') if c.strip()]
-        })
-        return redirect(url_for('index'))
-    return render_template_string('''
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <title>Add New Word</title>
-        <style>
-            body { font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; background-color: #f4f4f4; display: flex; justify-content: center; align-items: center; height: 100vh; margin: 0; }
-            .container { background: white; padding: 30px; border-radius: 10px; box-shadow: 0 4px 8px rgba(0,0,0,0.1); max-width: 600px; width: 100%; }
-            h1 { text-align: center; color: #333; }
-            form { display: flex; flex-direction: column; }
-            label { display: block; margin-bottom: 5px; font-weight: bold; }
-            input[type="text"] { padding: 10px; margin-bottom: 15px; border: 1px solid #ddd; border-radius: 5px; width: 100%; }
-            input[type="submit"] { background: #4CAF50; color: white; padding: 10px; border: none; border-radius: 5px; cursor: pointer; width: 100%; font-size: 16px; }
-            input[type="submit"]:hover { background: #45a049; }
-            .back-link { display: block; text-align: center; margin-top: 20px; background: #4CAF50; color: white; padding: 10px; border-radius: 5px; text-decoration: none; font-size: 16px; }
-            .back-link:hover { background: #45a049; }
-        </style>
-    </head>
-    <body>
-        <div class="container">
-            <h1>Add New Word</h1>
-            <form method="post">
-                <label>Word: <input type="text" name="word" required></label>
-                <label>Translation: <input type="text" name="translation" required></label>
-                <label>Part of Speech: <input type="text" name="partOfSpeech" placeholder="e.g., noun, verb" required></label>
-                <label>Examples: <input type="text" name="examples" placeholder="Separate with commas, e.g., sentence1, sentence2"></label>
-                <label>Categories: <input type="text" name="categories" placeholder="Separate with commas, e.g., Home & Living, A1 Basics"></label>
-                <input type="submit" value="Add Word">
-            </form>
-            <a href="/" class="back-link">Back to Home</a>
-        </div>
-    </body>
-    </html>
-    ''')
+            'categories': form_categories(),
+            'ownerId': current_owner(),
+            'shared': 'shared' in request.form,
+            'updatedAt': datetime.now(timezone.utc)
+        }
+        word_written(get_db()['vocabulary'].insert_one(doc).inserted_id, after=doc)
+        return redirect(url_for('main.index'))
+    return render('add')
+
+def load_config():
+    return {
+        'SECRET_KEY': os.getenv('SECRET_KEY', 'your-secret-key-here'),  # Add to .env
+        'SEND_FILE_MAX_AGE_DEFAULT': 365 * 24 * 3600,
+        'MONGODB_URI': os.getenv('MONGODB_URI', 'mongodb://localhost:27017/'),
+        'MONGODB_DATABASE': os.getenv('MONGODB_DATABASE', 'Vocabulary-finnish'),
+        # Per process; with N pre-fork workers a host opens up to N times this many connections.
+        'MONGODB_MAX_POOL_SIZE': os.getenv('MONGODB_MAX_POOL_SIZE', '50'),
+        'MONGODB_MIN_POOL_SIZE': os.getenv('MONGODB_MIN_POOL_SIZE', '0'),
+        'MONGODB_TIMEOUT_MS': os.getenv('MONGODB_TIMEOUT_MS', '5000'),
+        'MONGODB_SOCKET_TIMEOUT_MS': os.getenv('MONGODB_SOCKET_TIMEOUT_MS', '0'),
+        'MONGODB_READ_PREFERENCE': os.getenv('MONGODB_READ_PREFERENCE', 'primary'),
+    }
+
+def create_app(config=None):
+    # Nothing here talks to MongoDB: the client is created lazily by the first request in each process,
+    # so the app can be imported and forked by pre-fork servers (gunicorn --preload) safely.
+    app = Flask(__name__)
+    app.config.update(load_config())
+    app.config.update(config or {})
+    database.configure(app.config, [command_metrics])
+    login_manager.init_app(app)
+    app.register_blueprint(bp)
+    # Compile every page once at startup; render() then only executes the cached template code.
+    app.extensions['templates'] = {name: app.jinja_env.get_template(name + '.html') for name in TEMPLATE_NAMES}
+    # The stylesheet URL carries a content hash, so browsers can cache it for a year and still pick up edits.
+    with open(os.path.join(app.static_folder, 'style.css'), 'rb') as f:
+        app.jinja_env.globals['stylesheet_url'] = '/static/style.css?v=' + hashlib.md5(f.read()).hexdigest()[:12]
+    return app
+
+app = create_app()
 
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
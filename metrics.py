@@ -0,0 +1,164 @@
+import bisect
+import json
+import threading
+import time
+
+from pymongo import monitoring
+
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _labels(labels, extra=()):
+    items = list(labels) + list(extra)
+    if not items:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (name, _escape(value)) for name, value in items)
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+class Registry:
+    # Just enough of the Prometheus data model for this app: labelled counters, gauges and histograms.
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._help = {}
+        self._types = {}
+        self._values = {}
+
+    def _declare(self, name, kind, help):
+        self._types.setdefault(name, kind)
+        self._help.setdefault(name, help)
+
+    def observe(self, name, value, help='', **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._declare(name, 'histogram', help)
+            histogram = self._values.get(key)
+            if histogram is None:
+                histogram = self._values[key] = Histogram()
+            histogram.observe(value)
+
+    def inc(self, name, value=1, help='', **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._declare(name, 'counter', help)
+            self._values[key] = self._values.get(key, 0) + value
+
+    def set(self, name, value, help='', **labels):
+        with self._lock:
+            self._declare(name, 'gauge', help)
+            self._values[(name, tuple(sorted(labels.items())))] = value
+
+    def render(self):
+        lines = []
+        with self._lock:
+            for name in sorted(self._types):
+                lines.append('# HELP %s %s' % (name, self._help[name]))
+                lines.append('# TYPE %s %s' % (name, self._types[name]))
+                for (metric, labels), value in sorted(self._values.items(), key=lambda item: item[0]):
+                    if metric != name:
+                        continue
+                    if isinstance(value, Histogram):
+                        cumulative = 0
+                        for bound, count in zip(value.buckets + (float('inf'),), value.counts):
+                            cumulative += count
+                            le = '+Inf' if bound == float('inf') else repr(bound)
+                            lines.append('%s_bucket%s %d' % (name, _labels(labels, [('le', le)]), cumulative))
+                        lines.append('%s_sum%s %r' % (name, _labels(labels), value.sum))
+                        lines.append('%s_count%s %d' % (name, _labels(labels), value.count))
+                    else:
+                        lines.append('%s%s %r' % (name, _labels(labels), value))
+        return '\n'.join(lines) + '\n'
+
+def query_shape(value):
+    # Keeps the structure and operators of a filter but drops the values: {'word': '?', '_id': {'$gt': '?'}}.
+    if isinstance(value, dict):
+        return {key: query_shape(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [query_shape(value[0])] if value else []
+    return '?'
+
+def command_shape(command_name, command):
+    collection = command.get(command_name)
+    shape = {'command': command_name, 'collection': collection if isinstance(collection, str) else None}
+    if 'filter' in command:
+        shape['filter'] = query_shape(command['filter'])
+    if 'sort' in command:
+        shape['sort'] = dict(command['sort'])
+    if 'pipeline' in command:
+        shape['pipeline'] = [next(iter(stage)) for stage in command['pipeline']]
+    if command_name in ('update', 'delete') and command.get(command_name + 's'):
+        shape['filter'] = query_shape(command[command_name + 's'][0].get('q', {}))
+    return json.dumps(shape, sort_keys=True, default=str)
+
+def documents_returned(reply):
+    cursor = reply.get('cursor')
+    if isinstance(cursor, dict):
+        return len(cursor.get('firstBatch', cursor.get('nextBatch', [])))
+    return reply.get('n', 0)
+
+class RequestTimer:
+    __slots__ = ('started', 'db_seconds', 'render_seconds', 'commands', 'pending')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.db_seconds = 0.0
+        self.render_seconds = 0.0
+        self.commands = []
+        self.pending = {}
+
+_local = threading.local()
+
+def start_request():
+    _local.timer = RequestTimer()
+    return _local.timer
+
+def current_request():
+    return getattr(_local, 'timer', None)
+
+def finish_request():
+    timer = current_request()
+    _local.timer = None
+    return timer
+
+class CommandMetrics(monitoring.CommandListener):
+    # PyMongo calls these on the thread that issued the command, so the sync app can attribute
+    # database time to the request running on that thread.
+    def __init__(self, registry):
+        self.registry = registry
+
+    def started(self, event):
+        timer = current_request()
+        if timer is not None:
+            timer.pending[event.request_id] = command_shape(event.command_name, event.command)
+
+    def _finished(self, event, docs, status):
+        seconds = event.duration_micros / 1e6
+        timer = current_request()
+        if timer is not None:
+            timer.db_seconds += seconds
+            shape = timer.pending.pop(event.request_id, None)
+            if shape is not None:
+                timer.commands.append((shape, seconds))
+        self.registry.observe('mongodb_command_duration_seconds', seconds, 'MongoDB command latency.',
+                              command=event.command_name, database=event.database_name, status=status)
+        if docs:
+            self.registry.inc('mongodb_command_documents_total', docs, 'Documents returned by MongoDB commands.',
+                              command=event.command_name)
+
+    def succeeded(self, event):
+        self._finished(event, documents_returned(event.reply), 'ok')
+
+    def failed(self, event):
+        self._finished(event, 0, 'failed')
@@ -0,0 +1,87 @@
+from flask_login import UserMixin
+
+# Only the fields the pages actually show are requested from MongoDB.
+VOCAB_PROJECTION = {'word': 1, 'translation': 1, 'partOfSpeech': 1, 'part_of_speech': 1, 'examples': 1, 'categories': 1,
+                    'ownerId': 1, 'shared': 1}
+CATEGORY_PROJECTION = {'_id': 0, 'name': 1, 'description': 1}
+USER_SESSION_PROJECTION = {'name': 1, 'email': 1}
+USER_LOGIN_PROJECTION = {'name': 1, 'email': 1, 'password': 1}
+USER_LIST_PROJECTION = {'_id': 0, 'name': 1, 'email': 1}
+
+class VocabEntry:
+    __slots__ = ('id', 'word', 'translation', 'part_of_speech', 'examples', 'categories', 'owner_id', 'shared')
+
+    def __init__(self, id, word, translation, part_of_speech, examples, categories, owner_id=None, shared=False):
+        self.id = id
+        self.word = word
+        self.translation = translation
+        self.part_of_speech = part_of_speech
+        self.examples = examples
+        self.categories = categories
+        self.owner_id = owner_id
+        self.shared = shared
+
+    @classmethod
+    def from_doc(cls, doc):
+        # Older documents use part_of_speech; everything written by the app uses partOfSpeech.
+        return cls(
+            str(doc['_id']),
+            doc.get('word', ''),
+            doc.get('translation', ''),
+            doc.get('partOfSpeech') or doc.get('part_of_speech', ''),
+            doc.get('examples') or [],
+            doc.get('categories') or [],
+            str(doc['ownerId']) if doc.get('ownerId') else None,
+            bool(doc.get('shared')),
+        )
+
+class Category:
+    __slots__ = ('name', 'description', 'count')
+
+    def __init__(self, name, description, count=0):
+        self.name = name
+        self.description = description
+        self.count = count
+
+    @classmethod
+    def from_doc(cls, doc):
+        return cls(doc.get('name', ''), doc.get('description', ''))
+
+def with_counts(cats, counts):
+    # counts: {category name: words}. Names used by words but missing from the categories collection are
+    # listed after the known ones so nothing becomes unreachable.
+    for cat in cats:
+        cat.count = counts.get(cat.name, 0)
+    known = {cat.name for cat in cats}
+    return cats + [Category(name, '', count) for name, count in counts.items() if name not in known]
+
+def normalize_categories(values, canonical=None):
+    # Trims and collapses whitespace, drops case-insensitive duplicates and, when canonical
+    # ({casefolded name: name}) is given, spells known categories exactly as the categories collection does,
+    # so membership queries can use exact index matches.
+    result, seen = [], set()
+    for value in values:
+        name = ' '.join(str(value).split())
+        key = name.casefold()
+        if not name or key in seen:
+            continue
+        seen.add(key)
+        result.append(canonical.get(key, name) if canonical else name)
+    return result
+
+class UserSummary:
+    __slots__ = ('name', 'email')
+
+    def __init__(self, name, email):
+        self.name = name
+        self.email = email
+
+    @classmethod
+    def from_doc(cls, doc):
+        return cls(doc.get('name', ''), doc.get('email', ''))
+
+class User(UserMixin):
+    def __init__(self, user_doc):
+        self.id = str(user_doc['_id'])
+        self.name = user_doc.get('name', '')
+        self.email = user_doc.get('email', '')
@@ -0,0 +1,34 @@
+from datetime import datetime, timezone
+
+# Every word belongs to the user who added it (ownerId). Words marked shared are also visible, read-only,
+# to every other user. Queries go through these helpers so each page only touches the current user's data.
+OWNER_FIELDS = {'ownerId': 1, 'shared': 1}
+
+def owned(owner_id, query=None):
+    return dict(query or {}, ownerId=owner_id)
+
+def visible(owner_id, query=None):
+    # One $or branch per index, (ownerId, _id) and (shared, _id), so both seek and are merged in _id order.
+    query = query or {}
+    return {'$or': [dict(query, ownerId=owner_id), dict(query, shared=True)]}
+
+def tombstone(id, doc, deleted_at, unshared=False):
+    # Deletions are remembered with the word's owner and sharing, so they only reach users who could see the word.
+    # unshared marks a word that still exists but stopped being shared: gone for everyone except its owner.
+    return {'_id': id, 'deletedAt': deleted_at, 'ownerId': doc.get('ownerId'), 'shared': bool(doc.get('shared')),
+            'unshared': unshared}
+
+def visible_tombstones(owner_id, query=None):
+    query = query or {}
+    return {'$or': [dict(query, ownerId=owner_id, unshared={'$ne': True}),
+                    dict(query, shared=True, ownerId={'$ne': owner_id})]}
+
+def migrate(db, owner_id, shared=True):
+    # Words written before ownership existed go to one user; shared keeps them visible to everyone as before.
+    # Bumping updatedAt lets syncing clients and other workers' search indexes pick up the new owner.
+    result = db['vocabulary'].update_many({'ownerId': {'$exists': False}},
+                                          {'$set': {'ownerId': owner_id, 'shared': shared,
+                                                    'updatedAt': datetime.now(timezone.utc)}})
+    # The collection-wide statistics document is replaced by one per owner.
+    db['stats'].delete_one({'_id': 'vocabulary'})
+    return result.modified_count
@@ -0,0 +1,124 @@
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+
+from werkzeug.security import generate_password_hash, check_password_hash
+
+# e.g. 'scrypt', 'scrypt:65536:8:1' or 'pbkdf2:sha256:1000000'; existing hashes are upgraded on login.
+HASH_METHOD = os.getenv('PASSWORD_HASH_METHOD', 'scrypt')
+HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', str(os.cpu_count() or 2)))
+MAX_PENDING_HASHES = int(os.getenv('PASSWORD_HASH_MAX_PENDING', '32'))
+HASH_TIMEOUT = float(os.getenv('PASSWORD_HASH_TIMEOUT', '10'))
+
+class HashingBusy(Exception):
+    pass
+
+def _method_prefix(method):
+    # Werkzeug stores the full parameter string ('scrypt:32768:8:1') in front of the first '$'.
+    return generate_password_hash('', method).split('$', 1)[0]
+
+class PasswordHasher:
+    # Hashing runs in a process pool so it neither holds the GIL nor ties up request threads for long;
+    # at most max_pending hashes may be queued, beyond that callers get HashingBusy straight away.
+    def __init__(self, method=HASH_METHOD, workers=HASH_WORKERS, max_pending=MAX_PENDING_HASHES, timeout=HASH_TIMEOUT):
+        self.method = method
+        self.workers = workers
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._pool = None
+        self._pid = None
+        self._stored_method = None
+
+    def _executor(self):
+        # Created on first use in each process, so a pool is never inherited across a fork.
+        with self._lock:
+            if self._pool is None or self._pid != os.getpid():
+                # Never fork: the app process runs request, PyMongo monitor and cache threads, and a child forked
+                # while one of them holds a lock can deadlock. forkserver children start from a clean process.
+                methods = multiprocessing.get_all_start_methods()
+                context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+                self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+                self._pid = os.getpid()
+            return self._pool
+
+    def _discard(self, pool):
+        with self._lock:
+            if self._pool is pool:
+                self._pool = None
+        pool.shutdown(wait=False)
+
+    def _run(self, fn, *args):
+        # A worker that dies (the OOM killer, say) breaks the whole pool; one retry goes to a fresh one.
+        try:
+            return self._run_once(fn, *args)
+        except BrokenProcessPool:
+            try:
+                return self._run_once(fn, *args)
+            except BrokenProcessPool:
+                raise HashingBusy()
+
+    def _run_once(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            raise HashingBusy()
+        pool = self._executor()
+        try:
+            future = pool.submit(fn, *args)
+        except BaseException as e:
+            self._slots.release()
+            if isinstance(e, BrokenProcessPool):
+                self._discard(pool)
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            # The pool is backed up; the hash keeps its slot until it finishes.
+            raise HashingBusy()
+        except BrokenProcessPool:
+            self._discard(pool)
+            raise
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def check(self, pwhash, password):
+        return self._run(check_password_hash, pwhash, password)
+
+    def needs_rehash(self, pwhash):
+        # Learning the full parameter string costs one hash, so it is done once, in the pool like any other.
+        if self._stored_method is None:
+            self._stored_method = self._run(_method_prefix, self.method)
+        return pwhash.split('$', 1)[0] != self._stored_method
+
+class LoginThrottle:
+    # Sliding-window limit of login attempts per client address.
+    def __init__(self, attempts, window, clock=time.monotonic):
+        self.attempts = attempts
+        self.window = window
+        self._clock = clock
+        self._hits = {}
+        self._lock = threading.Lock()
+
+    def allow(self, key):
+        now = self._clock()
+        with self._lock:
+            hits = self._hits.get(key)
+            if hits is None:
+                if len(self._hits) > 10000:
+                    self._prune(now)
+                hits = self._hits[key] = deque()
+            while hits and hits[0] <= now - self.window:
+                hits.popleft()
+            if len(hits) >= self.attempts:
+                return False
+            hits.append(now)
+            return True
+
+    def _prune(self, now):
+        for key in [key for key, hits in self._hits.items() if not hits or hits[-1] <= now - self.window]:
+            del self._hits[key]
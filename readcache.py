@@ -0,0 +1,202 @@
+import itertools
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from cache import TTLCache
+
+log = logging.getLogger(__name__)
+
+WATCHED = ['vocabulary', 'categories', 'deleted_words']
+
+# How far before the previous poll a catch-up starts reading: covers writes whose updatedAt was stamped before
+# that poll but whose version bump landed after it, and clocks that differ a little between workers.
+CATCH_UP_OVERLAP = timedelta(seconds=60)
+
+class VocabularyCache:
+    # Read-through cache of vocabulary pages, single words and category lists, private to one worker process.
+    # A page belongs to one user and lists their own words plus the shared ones, so a changed word only drops
+    # its owner's pages, or every page while it is (or was) shared: each page is stamped with its owner's
+    # generation and the shared one, and is not looked up once either moves on. Single words are dropped by id.
+    # Local writes call invalidate_word(); writes from other workers (or the mongo shell) arrive through a change
+    # stream, which also watches deleted_words because a delete event does not say whose word it was. Change
+    # streams need a replica set, so against a standalone mongod the cache instead polls the meta version
+    # counter at most every poll_interval seconds and, when it moved, reads the words updated (updatedAt) and
+    # deleted (tombstones) since the previous poll. Every entry also expires after ttl seconds.
+    # on_change(change) is called for every vocabulary change event, polling passing the same events for what
+    # it read, and with None when the vocabulary changed in a way only a full reload can catch up with.
+    def __init__(self, maxsize, ttl, poll_interval, category_ttl=None, on_change=None, clock=time.monotonic):
+        self.pages = TTLCache(maxsize, ttl, clock)
+        self.words = TTLCache(maxsize, ttl, clock)
+        self.categories = TTLCache(4, ttl if category_ttl is None else category_ttl, clock)
+        self.poll_interval = poll_interval
+        self.on_change = on_change
+        self.mode = 'polling'
+        self.invalidations = 0
+        self._clock = clock
+        self._generation = 0
+        # Fresh values from one counter, so a generation never comes back to one a page was stamped with.
+        self._counter = itertools.count(1)
+        self._owner_generations = {}
+        self._shared_generation = 0
+        self._version = None
+        self._polled = None
+        self._checked = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def ensure_watching(self, get_db):
+        # Starts the change stream thread once per process, on first use, so it never survives a fork.
+        pid = os.getpid()
+        if self._pid != pid:
+            with self._lock:
+                if self._pid != pid:
+                    self._pid = pid
+                    self.mode = 'polling'
+                    self.clear()
+                    threading.Thread(target=self._watch, args=(get_db,), name='vocabulary-cache', daemon=True).start()
+        if self.mode == 'polling':
+            self._poll(get_db())
+
+    def _watch(self, get_db):
+        try:
+            with get_db().watch([{'$match': {'ns.coll': {'$in': WATCHED}}}], full_document='updateLookup') as changes:
+                self.mode = 'change_stream'
+                # Anything written between the first reads and the stream opening is dropped here.
+                self.clear()
+                self._notify(None)
+                for change in changes:
+                    self._apply(change)
+        except Exception as e:
+            # Standalone servers refuse change streams (PyMongoError); test doubles such as mongomock have no
+            # usable watch() at all. Either way polling takes over.
+            log.info('Vocabulary cache falls back to polling: %s', e)
+        self.mode = 'polling'
+        self.clear()
+        self._notify(None)
+
+    def _apply(self, change):
+        collection = change.get('ns', {}).get('coll')
+        doc = change.get('fullDocument')
+        if collection == 'categories':
+            self.categories.clear()
+        elif collection == 'deleted_words':
+            # A tombstone (written right after the delete or unshare) says whose word it was and whether it was
+            # shared; removed tombstones (reshares, expiry) have nothing to add to the vocabulary events.
+            if doc is not None:
+                self.invalidate_word(doc['_id'], doc.get('ownerId'), doc.get('shared'))
+        elif collection != 'vocabulary':
+            # A dropped database or collection.
+            self.clear()
+            self._notify(None)
+        elif change.get('operationType') == 'delete':
+            self.words.pop(change['documentKey']['_id'])
+            self._generation += 1
+            self._notify(change)
+        elif doc is not None:
+            fields = change.get('updateDescription') or {}
+            # A replacement, or an update of the shared flag, may have taken the word out of other users' pages.
+            unshared = change.get('operationType') == 'replace' or 'shared' in fields.get('updatedFields', {}) \
+                or 'shared' in fields.get('removedFields', [])
+            self.invalidate_word(doc['_id'], doc.get('ownerId'), doc.get('shared') or unshared)
+            self._notify(change)
+        else:
+            # Updated and deleted again before the lookup: the owner is unknown.
+            self.invalidate()
+            self._notify(change)
+
+    def _notify(self, change):
+        if self.on_change is not None:
+            self.on_change(change)
+
+    def _poll(self, db):
+        now = self._clock()
+        if self._polled is not None and now - self._polled < self.poll_interval:
+            return
+        self._polled = now
+        checked, self._checked = self._checked, datetime.now(timezone.utc)
+        version = (db['meta'].find_one({'_id': 'vocabulary'}, {'version': 1}) or {}).get('version', 0)
+        if self._version is not None and version != self._version:
+            if checked is None:
+                self.clear()
+                self._notify(None)
+            else:
+                self.categories.clear()
+                self._catch_up(db, checked - CATCH_UP_OVERLAP)
+        self._version = version
+
+    def _catch_up(self, db, since):
+        # Deletions first, so nothing read afterwards is dropped again. An unshare tombstone stands for a word
+        # that still exists; the vocabulary read brings it back.
+        for doc in db['deleted_words'].find({'deletedAt': {'$gt': since}}):
+            key = {'_id': doc['_id']}
+            self._apply({'ns': {'coll': 'deleted_words'}, 'operationType': 'insert', 'documentKey': key,
+                         'fullDocument': doc})
+            if not doc.get('unshared'):
+                self._apply({'ns': {'coll': 'vocabulary'}, 'operationType': 'delete', 'documentKey': key})
+        for doc in db['vocabulary'].find({'updatedAt': {'$gt': since}}):
+            self._apply({'ns': {'coll': 'vocabulary'}, 'operationType': 'update', 'documentKey': {'_id': doc['_id']},
+                         'fullDocument': doc})
+
+    def wrote(self, version):
+        # This process's own write moved the counter by one; the next poll need not treat it as foreign.
+        if self._version is not None and version == self._version + 1:
+            self._version = version
+
+    def _read(self, cache, key, load):
+        value = cache.get(key)
+        if value is None:
+            generation = self._generation
+            value = load()
+            # A write that landed while loading may not be in value; keep it out of the cache then.
+            if value is not None and generation == self._generation:
+                cache.set(key, value)
+        return value
+
+    def _page_stamp(self, owner_id):
+        return self._owner_generations.get(str(owner_id), 0), self._shared_generation
+
+    def page(self, owner_id, key, load):
+        # A page of owner_id's words and the shared ones. Outdated stamps are never looked up again and age out.
+        stamp = self._page_stamp(owner_id)
+        key = (stamp, key)
+        value = self.pages.get(key)
+        if value is None:
+            value = load()
+            # A write that landed while loading moved the stamp and may not be in value; keep it out then.
+            if value is not None and self._page_stamp(owner_id) == stamp:
+                self.pages.set(key, value)
+        return value
+
+    def word(self, id, load):
+        return self._read(self.words, id, load)
+
+    def category_list(self, key, load):
+        return self._read(self.categories, key, load)
+
+    def invalidate_word(self, id, owner_id, shared):
+        # The word's owner's pages go; every page does while the word is or was shared.
+        self._generation += 1
+        self.invalidations += 1
+        if shared:
+            self._shared_generation = next(self._counter)
+            self.pages.clear()
+        else:
+            self._owner_generations[str(owner_id)] = next(self._counter)
+        self.words.pop(id)
+
+    def invalidate(self):
+        self._generation += 1
+        self._shared_generation = next(self._counter)
+        self.invalidations += 1
+        self.pages.clear()
+        self.words.clear()
+
+    def clear(self):
+        self.invalidate()
+        self.categories.clear()
+
+    def stats(self):
+        return {'pages': self.pages.stats(), 'words': self.words.stats(), 'categories': self.categories.stats()}
@@ -0,0 +1,88 @@
+from datetime import timedelta
+
+from pymongo import UpdateOne
+
+from models import VocabEntry, VOCAB_PROJECTION
+from ownership import visible
+
+BATCH_SIZE = 20
+RELEARN_DELAY = timedelta(minutes=10)
+GRADES = (('again', 1), ('hard', 3), ('good', 4), ('easy', 5))
+STATE_FIELDS = {'wordId': 1, 'interval': 1, 'ease': 1, 'reps': 1, 'lapses': 1}
+
+def schedule(state, grade, now):
+    # SM-2: grade is 0-5, anything below 3 counts as forgotten and the card comes back shortly.
+    state = state or {}
+    ease = state.get('ease', 2.5)
+    reps = state.get('reps', 0)
+    interval = state.get('interval', 0)
+    lapses = state.get('lapses', 0)
+    if grade < 3:
+        reps, interval, lapses = 0, 0, lapses + 1
+        due_at = now + RELEARN_DELAY
+    else:
+        reps += 1
+        interval = 1 if reps == 1 else 6 if reps == 2 else max(1, round(interval * ease))
+        due_at = now + timedelta(days=interval)
+    ease = max(1.3, ease + 0.1 - (5 - grade) * (0.08 + (5 - grade) * 0.02))
+    return {'dueAt': due_at, 'interval': interval, 'ease': round(ease, 3), 'reps': reps, 'lapses': lapses,
+            'lastReviewedAt': now}
+
+class Card:
+    __slots__ = ('entry', 'state')
+
+    def __init__(self, entry, state):
+        self.entry = entry
+        self.state = state
+
+    @property
+    def is_new(self):
+        return self.state is None
+
+def next_batch(db, user_id, now, size=BATCH_SIZE):
+    # Due cards come straight off the (userId, dueAt) index; the rest of the batch is filled with words the
+    # user has never seen, read after the last word they were given so nothing is scanned twice. Only the user's
+    # own and shared words are reviewed.
+    due = list(db['reviews'].find({'userId': user_id, 'dueAt': {'$lte': now}}, STATE_FIELDS)
+               .sort('dueAt', 1).limit(size))
+    words = {}
+    if due:
+        words = {doc['_id']: doc for doc in db['vocabulary'].find(
+            visible(user_id, {'_id': {'$in': [r['wordId'] for r in due]}}), VOCAB_PROJECTION)}
+        missing = [r['_id'] for r in due if r['wordId'] not in words]
+        if missing:
+            # The word was deleted, or is no longer shared, since it was scheduled.
+            db['reviews'].delete_many({'_id': {'$in': missing}})
+    cards = [Card(VocabEntry.from_doc(words[r['wordId']]), r) for r in due if r['wordId'] in words]
+    if len(cards) < size:
+        progress = db['review_progress'].find_one({'_id': user_id}) or {}
+        query = {'_id': {'$gt': progress['lastWordId']}} if progress.get('lastWordId') else {}
+        new_words = db['vocabulary'].find(visible(user_id, query), VOCAB_PROJECTION).sort('_id', 1).limit(size - len(cards))
+        cards += [Card(VocabEntry.from_doc(doc), None) for doc in new_words]
+    return cards
+
+def due_count(db, user_id, now, cap=1000):
+    return db['reviews'].count_documents({'userId': user_id, 'dueAt': {'$lte': now}}, limit=cap)
+
+def record_answers(db, user_id, answers, shown_new, now):
+    # answers: {word ObjectId: grade}; shown_new: ids of the new words on the page. Current states are read
+    # in one query and every write goes out in one unordered bulk_write.
+    word_ids = list(answers)
+    states = {}
+    if word_ids:
+        states = {doc['wordId']: doc for doc in db['reviews'].find({'userId': user_id, 'wordId': {'$in': word_ids}},
+                                                                   STATE_FIELDS)}
+    ops = [UpdateOne({'userId': user_id, 'wordId': word_id},
+                     {'$set': schedule(states.get(word_id), grade, now)}, upsert=True)
+           for word_id, grade in answers.items()]
+    # New words shown but left unanswered are scheduled as due now; the progress cursor moves past them below.
+    ops += [UpdateOne({'userId': user_id, 'wordId': word_id},
+                      {'$setOnInsert': {'dueAt': now, 'interval': 0, 'ease': 2.5, 'reps': 0, 'lapses': 0}}, upsert=True)
+            for word_id in shown_new if word_id not in answers]
+    if not ops:
+        return 0
+    db['reviews'].bulk_write(ops, ordered=False)
+    new_ids = [word_id for word_id in word_ids if word_id not in states] + list(shown_new)
+    if new_ids:
+        db['review_progress'].update_one({'_id': user_id}, {'$max': {'lastWordId': max(new_ids)}}, upsert=True)
+    return len(answers)
@@ -0,0 +1,261 @@
+import bisect
+import re
+import threading
+import unicodedata
+from collections import Counter
+
+SEARCH_FIELDS = {'word': 1, 'translation': 1, 'partOfSpeech': 1, 'part_of_speech': 1, 'ownerId': 1, 'shared': 1}
+TOKEN_RE = re.compile(r'\w+')
+
+def fold(text):
+    # Case- and diacritic-insensitive form: 'Äiti' and 'aiti' both fold to 'aiti', 'å' to 'a'.
+    text = text.casefold()
+    if text.isascii():
+        return text
+    return ''.join(c for c in unicodedata.normalize('NFKD', text) if not unicodedata.combining(c))
+
+def terms_for(word, translation):
+    terms = set()
+    for text in (word, translation):
+        folded = fold(text or '').strip()
+        if folded:
+            terms.add(folded)
+            terms.update(TOKEN_RE.findall(folded))
+    return terms
+
+def trigrams(term):
+    padded = '  %s ' % term
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def within_distance(a, b, limit):
+    # Levenshtein distance <= limit. Only cells within limit of the diagonal can stay under it, so each row
+    # fills just that band, and the check gives up as soon as a whole band exceeds the limit.
+    if abs(len(a) - len(b)) > limit:
+        return False
+    start = 0
+    while start < len(a) and start < len(b) and a[start] == b[start]:
+        start += 1
+    end = 0
+    while end < len(a) - start and end < len(b) - start and a[-1 - end] == b[-1 - end]:
+        end += 1
+    a, b = a[start:len(a) - end], b[start:len(b) - end]
+    if not a or not b:
+        return max(len(a), len(b)) <= limit
+    over = limit + 1
+    previous = [j if j <= limit else over for j in range(len(b) + 1)]
+    for i, ca in enumerate(a, 1):
+        low, high = max(1, i - limit), min(len(b), i + limit)
+        current = [over] * (len(b) + 1)
+        if i <= limit:
+            current[0] = i
+        for j in range(low, high + 1):
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != b[j - 1]))
+        if min(current[low - 1:high + 1]) > limit:
+            return False
+        previous = current
+    return previous[-1] <= limit
+
+# Trigrams shared by more terms of a given length than this are too common to narrow anything down (think
+# ' ka' or 'ssa' in Finnish); fuzzy lookups draw candidates from rarer trigrams only.
+MAX_GRAM_TERMS = 2500
+
+def max_typos(query):
+    if len(query) < 4:
+        return 0
+    return 1 if len(query) < 8 else 2
+
+# Partition key for shared words, which every user sees; other words are partitioned by owner id.
+SHARED = object()
+
+class _Partition:
+    # Term lookups over one owner's (or the shared) words: ids per term in insertion order, a sorted term
+    # list for prefix lookups and a trigram index, bucketed by term length, for typo-tolerant matches.
+    def __init__(self):
+        self.ids_by_term = {}
+        self.sorted_terms = []
+        self.terms_by_gram = {}
+
+    def add(self, id, terms, sort=True):
+        for term in terms:
+            ids = self.ids_by_term.get(term)
+            if ids is None:
+                # A dict keeps ids in insertion order, so lookups can stop after the first few hits unsorted.
+                ids = self.ids_by_term[term] = {}
+                if sort:
+                    bisect.insort(self.sorted_terms, term)
+                for gram in trigrams(term):
+                    self.terms_by_gram.setdefault(gram, {}).setdefault(len(term), set()).add(term)
+            ids[id] = None
+
+    def sort(self):
+        self.sorted_terms = sorted(self.ids_by_term)
+
+    def remove(self, id, terms):
+        for term in terms:
+            ids = self.ids_by_term[term]
+            ids.pop(id, None)
+            if not ids:
+                del self.ids_by_term[term]
+                del self.sorted_terms[bisect.bisect_left(self.sorted_terms, term)]
+                for gram in trigrams(term):
+                    buckets = self.terms_by_gram[gram]
+                    terms_of_length = buckets[len(term)]
+                    terms_of_length.discard(term)
+                    if not terms_of_length:
+                        del buckets[len(term)]
+                        if not buckets:
+                            del self.terms_by_gram[gram]
+
+    def prefix_terms(self, query):
+        terms = self.sorted_terms
+        for i in range(bisect.bisect_left(terms, query), len(terms)):
+            if not terms[i].startswith(query):
+                break
+            yield terms[i]
+
+    def fuzzy_terms(self, query, limit):
+        grams = trigrams(query)
+        # Each typo can break at most three trigrams, so anything sharing fewer cannot match; and a term whose
+        # length is off by more than limit cannot match either, so only those length buckets are read.
+        needed = max(1, len(grams) - 3 * limit)
+        lengths = range(len(query) - limit, len(query) + limit + 1)
+        postings = []
+        for gram in grams:
+            buckets = self.terms_by_gram.get(gram, {})
+            sets = [buckets[n] for n in lengths if n in buckets]
+            postings.append((sum(map(len, sets)), sets))
+        postings.sort(key=lambda posting: posting[0])
+        shared = Counter()
+        skipped = 0
+        for i, (size, sets) in enumerate(postings):
+            if i and size > MAX_GRAM_TERMS:
+                # Too common to be worth counting (the rarest is always counted); assume every candidate has it.
+                skipped += 1
+                continue
+            for terms in sets:
+                shared.update(terms)
+        needed -= skipped
+        if needed < 1:
+            # Nothing but common trigrams: fall back to candidates sharing at least one of the rarer ones.
+            needed = 1
+        # Most shared trigrams first; the caller stops pulling once it has enough hits.
+        for term, n in shared.most_common():
+            if n >= needed and within_distance(query, term, limit):
+                yield term
+
+class SearchIndex:
+    # In-memory index over word and translation, kept in sync with add()/remove() on every write. Words are
+    # partitioned by owner, with one partition for shared words, so a user's search only walks their own
+    # words and the shared ones.
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._reset()
+
+    def _reset(self):
+        self.built = False
+        self._entries = {}
+        self._terms_by_id = {}
+        self._partitions = {}
+
+    def build(self, docs):
+        with self._lock:
+            self._reset()
+            for doc in docs:
+                self._add(doc, sort=False)
+            for partition in self._partitions.values():
+                partition.sort()
+            self.built = True
+
+    def ensure_built(self, load_docs):
+        if not self.built:
+            with self._lock:
+                if not self.built:
+                    self.build(load_docs())
+
+    def invalidate(self):
+        # Drops everything; the next search rebuilds from the database.
+        with self._lock:
+            self._reset()
+
+    def add(self, doc):
+        with self._lock:
+            if self.built:
+                self._remove(str(doc['_id']))
+                self._add(doc)
+
+    def remove(self, id):
+        with self._lock:
+            if self.built:
+                self._remove(str(id))
+
+    def _add(self, doc, sort=True):
+        id = str(doc['_id'])
+        word = doc.get('word', '')
+        translation = doc.get('translation', '')
+        owner = str(doc['ownerId']) if doc.get('ownerId') else None
+        shared = bool(doc.get('shared'))
+        self._entries[id] = (word, translation, doc.get('partOfSpeech') or doc.get('part_of_speech', ''), owner,
+                             shared)
+        terms = terms_for(word, translation)
+        self._terms_by_id[id] = terms
+        key = SHARED if shared else owner
+        partition = self._partitions.get(key)
+        if partition is None:
+            partition = self._partitions[key] = _Partition()
+        partition.add(id, terms, sort)
+
+    def _remove(self, id):
+        entry = self._entries.pop(id, None)
+        if entry is None:
+            return
+        key = SHARED if entry[4] else entry[3]
+        partition = self._partitions[key]
+        partition.remove(id, self._terms_by_id.pop(id))
+        if not partition.ids_by_term:
+            del self._partitions[key]
+
+    def _visible_partitions(self, owner):
+        # owner=None means no scoping (e.g. CLI use); otherwise the user's own words plus shared ones.
+        if owner is None:
+            return list(self._partitions.values())
+        return [self._partitions[key] for key in (owner, SHARED) if key in self._partitions]
+
+    def _result(self, id):
+        word, translation, part_of_speech, owner = self._entries[id][:4]
+        return {'id': id, 'word': word, 'translation': translation, 'partOfSpeech': part_of_speech, 'ownerId': owner}
+
+    def search(self, query, limit=20, owner=None):
+        query = fold(query).strip()
+        if not query:
+            return []
+        with self._lock:
+            partitions = self._visible_partitions(owner)
+            found = []
+            seen = set()
+
+            def collect(lookup):
+                for partition in partitions:
+                    for term in lookup(partition):
+                        for id in partition.ids_by_term.get(term, ()):
+                            if id not in seen:
+                                seen.add(id)
+                                found.append(id)
+                                if len(found) >= limit:
+                                    return True
+                return False
+
+            done = collect(lambda partition: [query]) or collect(lambda partition: partition.prefix_terms(query))
+            typos = max_typos(query)
+            if not done and typos:
+                collect(lambda partition: partition.fuzzy_terms(query, typos))
+            return [self._result(id) for id in found]
+
+    def words(self, query, owner=None):
+        # Entries whose whole word folds to the same form as query, e.g. 'paiva' finds 'päivä'.
+        query = fold(query).strip()
+        with self._lock:
+            return [self._result(id) for partition in self._visible_partitions(owner)
+                    for id in partition.ids_by_term.get(query, ()) if fold(self._entries[id][0]).strip() == query]
+
+    def __len__(self):
+        return len(self._entries)
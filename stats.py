@@ -0,0 +1,126 @@
+from collections import Counter
+from datetime import datetime, timezone
+
+# One statistics document per owner, keyed by the owner's user id, plus one for every shared word (SHARED).
+# An owner's document also counts which of their own words are shared, so category pages (own words plus
+# everybody's shared ones) can be counted without counting shared words of the owner twice.
+STATS_FIELDS = {'ownerId': 1, 'shared': 1, 'categories': 1, 'partOfSpeech': 1, 'part_of_speech': 1}
+SHARED = 'shared'
+NO_PART_OF_SPEECH = 'N/A'
+
+# Category and part-of-speech names become field names, so '.' and a leading '$' are swapped for
+# their full-width forms, as the MongoDB docs recommend.
+def _key(name):
+    return name.replace('.', '．').replace('$', '＄')
+
+def _name(key):
+    return key.replace('．', '.').replace('＄', '$')
+
+def _part_of_speech(doc):
+    return doc.get('partOfSpeech') or doc.get('part_of_speech') or NO_PART_OF_SPEECH
+
+# One pass over a set of words; the $facet branches share the same scan.
+PIPELINE = [
+    {'$project': {
+        'shared': 1,
+        'categories': {'$ifNull': ['$categories', []]},
+        'pos': {'$let': {
+            'vars': {'pos': {'$ifNull': ['$partOfSpeech', '']}},
+            'in': {'$cond': [{'$eq': ['$$pos', '']}, {'$ifNull': ['$part_of_speech', NO_PART_OF_SPEECH]}, '$$pos']},
+        }},
+    }},
+    {'$facet': {
+        'total': [{'$count': 'n'}],
+        'byCategory': [{'$unwind': '$categories'}, {'$group': {'_id': '$categories', 'n': {'$sum': 1}}}],
+        'byPartOfSpeech': [{'$group': {'_id': '$pos', 'n': {'$sum': 1}}}],
+        'sharedByCategory': [{'$match': {'shared': True}}, {'$unwind': '$categories'},
+                             {'$group': {'_id': '$categories', 'n': {'$sum': 1}}}],
+    }},
+]
+
+def pipeline(owner_id):
+    # Only the owner's (or the shared) words, read through the (ownerId, _id) or (shared, _id) index.
+    return [{'$match': {'shared': True} if owner_id == SHARED else {'ownerId': owner_id}}] + PIPELINE
+
+def _category_counts(rows):
+    return {_key(str(row['_id'])): row['n'] for row in rows if row['_id'] not in (None, '')}
+
+def stats_doc(result, owner_id):
+    return {
+        '_id': owner_id,
+        'total': result['total'][0]['n'] if result['total'] else 0,
+        'byCategory': _category_counts(result['byCategory']),
+        'byPartOfSpeech': {_key(str(row['_id']) or NO_PART_OF_SPEECH): row['n'] for row in result['byPartOfSpeech']},
+        'sharedByCategory': _category_counts(result.get('sharedByCategory', [])),
+        'computedAt': datetime.now(timezone.utc),
+    }
+
+def recompute(db, owner_id):
+    doc = stats_doc(next(db['vocabulary'].aggregate(pipeline(owner_id))), owner_id)
+    db['stats'].replace_one({'_id': owner_id}, doc, upsert=True)
+    return doc
+
+def _sorted_counts(counts):
+    return sorted(((_name(key), n) for key, n in counts.items() if n > 0), key=lambda item: (-item[1], item[0]))
+
+def load(db, owner_id, refresh=False):
+    doc = None if refresh else db['stats'].find_one({'_id': owner_id})
+    if is_stale(doc):
+        doc = recompute(db, owner_id)
+    return doc
+
+def is_stale(doc):
+    # Missing, or written before sharedByCategory was counted.
+    return doc is None or 'sharedByCategory' not in doc
+
+def get_stats(db, owner_id, refresh=False):
+    return summarize(load(db, owner_id, refresh))
+
+def get_category_counts(db, owner_id):
+    return category_counts(load(db, owner_id), load(db, SHARED))
+
+def category_counts(own, shared):
+    # {category: words} as the owner's category pages list them: their own words and everybody's shared ones.
+    counts = Counter(own.get('byCategory', {}))
+    counts.update(shared.get('byCategory', {}))
+    counts.subtract(own.get('sharedByCategory', {}))
+    return dict(_sorted_counts(counts))
+
+def summarize(doc):
+    return {
+        'total': doc.get('total', 0),
+        'by_category': _sorted_counts(doc.get('byCategory', {})),
+        'by_part_of_speech': _sorted_counts(doc.get('byPartOfSpeech', {})),
+        'computed_at': doc.get('computedAt'),
+    }
+
+def _delta(doc, sign, inc):
+    inc['total'] += sign
+    for category, n in Counter(doc.get('categories') or []).items():
+        inc['byCategory.' + _key(category)] += sign * n
+    inc['byPartOfSpeech.' + _key(_part_of_speech(doc))] += sign
+
+def _shared_delta(doc, sign, inc, shared_inc):
+    if doc.get('shared'):
+        _delta(doc, sign, shared_inc)
+        for category, n in Counter(doc.get('categories') or []).items():
+            inc['sharedByCategory.' + _key(category)] += sign * n
+
+def record_changes(db, changes):
+    # (before, after) pairs of word documents, None for an insert/delete; only the net difference is applied,
+    # with one $inc per owner and one for SHARED. A word never changes owner, so before (or after, for inserts)
+    # names it.
+    incs = {SHARED: Counter()}
+    for before, after in changes:
+        inc = incs.setdefault((before if before is not None else after).get('ownerId'), Counter())
+        if before is not None:
+            _delta(before, -1, inc)
+            _shared_delta(before, -1, inc, incs[SHARED])
+        if after is not None:
+            _delta(after, 1, inc)
+            _shared_delta(after, 1, inc, incs[SHARED])
+    for owner_id, inc in incs.items():
+        inc = {field: n for field, n in inc.items() if n}
+        if inc and owner_id is not None:
+            # No upsert: if the document is missing the next read rebuilds it from scratch.
+            db['stats'].update_one({'_id': owner_id}, {'$inc': inc})
@@ -0,0 +1,226 @@
+import io
+from datetime import datetime, timedelta, timezone
+
+import mongomock
+import pytest
+from bson import ObjectId
+from werkzeug.security import generate_password_hash
+
+import main
+import ownership
+import review
+import stats
+import transfer
+from benchmarks import routes
+from cache import TTLCache
+from search import SearchIndex
+
+NOW = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+@pytest.fixture
+def db():
+    database = mongomock.MongoClient()['vocabulary_test']
+    routes.use_database(database)
+    yield database
+    routes.use_database(None)
+
+@pytest.fixture
+def login(db):
+    password = generate_password_hash('secret', 'pbkdf2:sha256:1000')
+
+    def login(email):
+        db['users'].insert_one({'name': email, 'email': email, 'password': password})
+        client = main.app.test_client()
+        assert client.post('/login', data={'email': email, 'password': 'secret'}).status_code == 302
+        return client
+    return login
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def word(word, owner_id, translation='', shared=False, categories=(), part_of_speech='noun'):
+    return {'_id': ObjectId(), 'word': word, 'translation': translation, 'ownerId': owner_id, 'shared': shared,
+            'categories': list(categories), 'partOfSpeech': part_of_speech}
+
+# SM-2 scheduling
+
+def test_schedule_first_reviews_use_fixed_intervals():
+    first = review.schedule(None, 4, NOW)
+    assert (first['reps'], first['interval'], first['dueAt']) == (1, 1, NOW + timedelta(days=1))
+    second = review.schedule(first, 4, NOW)
+    assert (second['reps'], second['interval']) == (2, 6)
+    third = review.schedule(second, 4, NOW)
+    assert third['interval'] == round(6 * second['ease'])
+
+def test_schedule_lapse_resets_and_comes_back_soon():
+    state = {'ease': 2.5, 'reps': 3, 'interval': 15, 'lapses': 0}
+    lapsed = review.schedule(state, 1, NOW)
+    assert (lapsed['reps'], lapsed['interval'], lapsed['lapses']) == (0, 0, 1)
+    assert lapsed['dueAt'] == NOW + review.RELEARN_DELAY
+    assert lapsed['ease'] < 2.5
+
+def test_schedule_ease_never_drops_below_minimum():
+    state = None
+    for _ in range(20):
+        state = review.schedule(state, 0, NOW)
+    assert state['ease'] == 1.3
+
+# Search index
+
+def test_search_prefix_fuzzy_and_diacritics():
+    index = SearchIndex()
+    index.build([word('päivä', 'a', translation='day'), word('talo', 'a', translation='house')])
+    assert [r['word'] for r in index.search('paiv', owner='a')] == ['päivä']
+    assert [r['word'] for r in index.search('tallo', owner='a')] == ['talo']
+    assert [r['word'] for r in index.search('house', owner='a')] == ['talo']
+    assert [r['word'] for r in index.words('PAIVA', owner='a')] == ['päivä']
+
+def test_search_add_remove_and_owner_scope():
+    index = SearchIndex()
+    mine, theirs, shared = word('kissa', 'a'), word('kisko', 'b'), word('kissat', 'b', shared=True)
+    index.build([mine, theirs])
+    index.add(shared)
+    assert {r['word'] for r in index.search('kis', owner='a')} == {'kissa', 'kissat'}
+    assert {r['word'] for r in index.search('kis')} == {'kissa', 'kisko', 'kissat'}
+    index.add(dict(shared, shared=False))
+    assert [r['word'] for r in index.search('kis', owner='a')] == ['kissa']
+    index.remove(mine['_id'])
+    assert index.search('kissa', owner='a') == []
+    assert len(index) == 2
+
+def test_search_results_carry_owner():
+    index = SearchIndex()
+    index.build([word('koira', 'a', shared=True)])
+    assert index.search('koira', owner='b')[0]['ownerId'] == 'a'
+
+# TTL cache
+
+def test_ttl_cache_expiry():
+    clock = Clock()
+    cache = TTLCache(10, 5, clock)
+    cache.set('a', 1)
+    clock.now = 4.9
+    assert cache.get('a') == 1
+    clock.now = 5
+    assert cache.get('a') is None
+
+def test_ttl_cache_evicts_least_recently_used():
+    cache = TTLCache(2, 60, Clock())
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+    assert (cache.get('a'), cache.get('b'), cache.get('c')) == (1, None, 3)
+    assert cache.stats()['size'] == 2
+
+# Statistics
+
+def test_record_changes_matches_recompute(db):
+    owner, other = ObjectId(), ObjectId()
+    docs = [word('yksi', owner, categories=['Numbers']), word('kaksi', owner, shared=True, categories=['Numbers']),
+            word('kolme', other, shared=True, categories=['Numbers', 'A1'], part_of_speech='')]
+    db['vocabulary'].insert_many(docs)
+    for owner_id in (owner, other, stats.SHARED):
+        stats.recompute(db, owner_id)
+
+    edited = dict(docs[0], shared=True, categories=['Numbers', 'A1'])
+    new = word('neljä', owner, categories=['Numbers'])
+    db['vocabulary'].replace_one({'_id': edited['_id']}, edited)
+    db['vocabulary'].insert_one(new)
+    db['vocabulary'].delete_one({'_id': docs[2]['_id']})
+    stats.record_changes(db, [(docs[0], edited), (None, new), (docs[2], None)])
+
+    for owner_id in (owner, other, stats.SHARED):
+        incremental = stats.summarize(db['stats'].find_one({'_id': owner_id}))
+        assert {k: v for k, v in incremental.items() if k != 'computed_at'} == \
+            {k: v for k, v in stats.get_stats(db, owner_id, refresh=True).items() if k != 'computed_at'}
+
+def test_category_counts_match_visible_words(db):
+    owner, other = ObjectId(), ObjectId()
+    db['vocabulary'].insert_many([word('yksi', owner, categories=['Numbers']),
+                                  word('kaksi', owner, shared=True, categories=['Numbers']),
+                                  word('kolme', other, shared=True, categories=['Numbers']),
+                                  word('neljä', other, categories=['Numbers'])])
+    assert stats.get_category_counts(db, owner) == {'Numbers': 3}
+    assert stats.get_category_counts(db, other) == {'Numbers': 3}
+
+# Keyset pagination
+
+def page_docs(n):
+    return [{'_id': i} for i in range(n)]
+
+def test_keyset_result_first_and_middle_pages():
+    assert main.keyset_result(page_docs(3), None, None, 2) == (page_docs(2), None, '1')
+    assert main.keyset_result(page_docs(2), 5, None, 2) == (page_docs(2), '0', None)
+
+def test_keyset_result_backwards_page_is_reversed():
+    # Going back, docs arrive in descending _id order.
+    docs, prev_cursor, next_cursor = main.keyset_result([{'_id': 4}, {'_id': 3}, {'_id': 2}], None, 5, 2)
+    assert docs == [{'_id': 3}, {'_id': 4}]
+    assert (prev_cursor, next_cursor) == ('3', '4')
+
+def test_keyset_result_empty():
+    assert main.keyset_result([], None, None, 2) == ([], None, None)
+
+# Import rows
+
+def test_iter_rows_reports_bad_rows_and_keeps_going():
+    data = b'{"word": "yksi"}\n[1]\n{"translation": "two"}\n\xe4iti\nnot json\n{"word": "kolme"}\n'
+    rows = list(transfer.iter_rows(io.BytesIO(data), 'jsonl'))
+    assert [line for line, _ in rows] == [1, 2, 3, 4, 5, 6]
+    assert rows[0][1]['word'] == 'yksi' and rows[5][1]['word'] == 'kolme'
+    assert rows[1][1] == 'expected a JSON object'
+    assert rows[2][1] == 'missing word'
+    assert 'UTF-8' in rows[3][1]
+    assert isinstance(rows[4][1], str)
+
+def test_iter_rows_csv_with_bom_and_bad_encoding():
+    data = '﻿word,translation,categories\nyksi,one,Numbers|A1\n'.encode() + b'\xe4iti,mother,\n'
+    rows = list(transfer.iter_rows(io.BytesIO(data), 'csv'))
+    assert rows[0] == (2, {'word': 'yksi', 'translation': 'one', 'partOfSpeech': '', 'examples': [],
+                           'categories': ['Numbers', 'A1']})
+    assert rows[1][0] == 3 and 'UTF-8' in rows[1][1]
+
+# Deletion tombstones
+
+def test_visible_tombstones(db):
+    me, other = ObjectId(), ObjectId()
+    mine = ownership.tombstone(ObjectId(), {'ownerId': me}, NOW)
+    my_unshared = ownership.tombstone(ObjectId(), {'ownerId': me, 'shared': True}, NOW, unshared=True)
+    theirs_shared = ownership.tombstone(ObjectId(), {'ownerId': other, 'shared': True}, NOW)
+    theirs_unshared = ownership.tombstone(ObjectId(), {'ownerId': other, 'shared': True}, NOW, unshared=True)
+    theirs_private = ownership.tombstone(ObjectId(), {'ownerId': other}, NOW)
+    db['deleted_words'].insert_many([mine, my_unshared, theirs_shared, theirs_unshared, theirs_private])
+    seen = {doc['_id'] for doc in db['deleted_words'].find(ownership.visible_tombstones(me, {'deletedAt': {'$gte': NOW}}))}
+    # My own unshared word still exists for me; other users' words only matter while they were shared.
+    assert seen == {mine['_id'], theirs_shared['_id'], theirs_unshared['_id']}
+
+# The app
+
+def add(client, word, shared=False, categories=''):
+    form = {'word': word, 'translation': 'x', 'partOfSpeech': 'noun', 'examples': '', 'categories': categories}
+    if shared:
+        form['shared'] = 'on'
+    assert client.post('/add', data=form).status_code == 302
+
+def test_search_offers_edit_only_for_own_words(login):
+    alice, bob = login('alice@example.com'), login('bob@example.com')
+    add(alice, 'jaettu', shared=True)
+    add(alice, 'oma')
+    assert '/edit/' in alice.get('/search?q=jaettu').get_data(as_text=True)
+    page = bob.get('/search?q=jaettu').get_data(as_text=True)
+    assert 'jaettu' in page and '/edit/' not in page
+    assert bob.get('/api/search?q=oma').get_json()['results'] == []
+
+def test_category_page_and_counts_after_writes(login, db):
+    db['categories'].insert_one({'name': 'A1 Basics', 'description': 'First words'})
+    alice, bob = login('alice@example.com'), login('bob@example.com')
+    add(alice, 'talo', categories='a1 basics')
+    add(bob, 'kissa', shared=True, categories='A1 Basics')
+    assert '(2 words)' in alice.get('/categories').get_data(as_text=True)
+    page = alice.get('/categories/a1%20basics').get_data(as_text=True)
+    assert 'talo' in page and 'kissa' in page and 'First words' in page
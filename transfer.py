@@ -0,0 +1,147 @@
+import csv
+import io
+import json
+from datetime import datetime, timezone
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+FORMATS = ('csv', 'jsonl')
+FIELDS = ['word', 'translation', 'partOfSpeech', 'examples', 'categories']
+EXPORT_PROJECTION = {'word': 1, 'translation': 1, 'partOfSpeech': 1, 'part_of_speech': 1, 'examples': 1, 'categories': 1}
+# Examples often contain commas, so list cells in CSV files are separated with '|'.
+LIST_SEPARATOR = '|'
+IMPORT_BATCH_SIZE = 1000
+MAX_REPORTED_ERRORS = 100
+
+def guess_format(filename, default='jsonl'):
+    ext = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+    return ext if ext in FORMATS else default
+
+def _list(value):
+    if value is None:
+        return []
+    if isinstance(value, str):
+        value = value.split(LIST_SEPARATOR)
+    if not isinstance(value, list):
+        raise ValueError('expected a list or a %r-separated string' % LIST_SEPARATOR)
+    return [str(item).strip() for item in value if str(item).strip()]
+
+def row_to_doc(row):
+    word = str(row.get('word') or '').strip()
+    if not word:
+        raise ValueError('missing word')
+    return {
+        'word': word,
+        'translation': str(row.get('translation') or '').strip(),
+        'partOfSpeech': str(row.get('partOfSpeech') or row.get('part_of_speech') or '').strip(),
+        'examples': _list(row.get('examples')),
+        'categories': _list(row.get('categories')),
+    }
+
+def _decode_lines(stream, bad_lines):
+    # UTF-8 never has a newline byte inside a character, so each line can be decoded on its own. A line that is
+    # not UTF-8 (e.g. a Latin-1 export) becomes a blank line and its number goes to bad_lines.
+    for line_num, raw in enumerate(stream, 1):
+        try:
+            line = raw.decode('utf-8')
+        except UnicodeDecodeError:
+            bad_lines.append(line_num)
+            yield '\n'
+            continue
+        yield line.lstrip('\ufeff') if line_num == 1 else line
+
+def _decode_errors(bad_lines):
+    while bad_lines:
+        yield bad_lines.pop(0), 'not valid UTF-8; save the file with UTF-8 encoding'
+
+def iter_rows(stream, fmt):
+    # Yields (line number, document or error message) without reading the whole upload into memory.
+    bad_lines = []
+    lines = _decode_lines(stream, bad_lines)
+    if fmt == 'csv':
+        reader = csv.DictReader(lines)
+        for row in reader:
+            yield from _decode_errors(bad_lines)
+            try:
+                yield reader.line_num, row_to_doc(row)
+            except ValueError as e:
+                yield reader.line_num, str(e)
+        yield from _decode_errors(bad_lines)
+        return
+    for line_num, line in enumerate(lines, 1):
+        yield from _decode_errors(bad_lines)
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+            if not isinstance(row, dict):
+                raise ValueError('expected a JSON object')
+            yield line_num, row_to_doc(row)
+        except ValueError as e:
+            yield line_num, str(e)
+
+def _flush(collection, ops, lines, summary):
+    try:
+        result = collection.bulk_write(ops, ordered=False)
+    except BulkWriteError as e:
+        result = None
+        details = e.details
+        for error in details.get('writeErrors', []):
+            _error(summary, lines[error['index']], error.get('errmsg', 'write failed'))
+        summary['inserted'] += details.get('nUpserted', 0)
+        summary['updated'] += details.get('nModified', 0)
+    if result is not None:
+        summary['inserted'] += result.upserted_count
+        summary['updated'] += result.modified_count
+
+def _error(summary, line, message):
+    summary['failed'] += 1
+    if len(summary['errors']) < MAX_REPORTED_ERRORS:
+        summary['errors'].append({'line': line, 'error': message})
+
+def import_rows(collection, rows, owner_id, batch_size=IMPORT_BATCH_SIZE):
+    # Upserts keyed on the owner's word, sent as unordered bulk writes so one bad row does not stop the batch.
+    summary = {'processed': 0, 'inserted': 0, 'updated': 0, 'failed': 0, 'errors': []}
+    ops, lines = [], []
+    for line, doc in rows:
+        summary['processed'] += 1
+        if isinstance(doc, str):
+            _error(summary, line, doc)
+            continue
+        doc['updatedAt'] = datetime.now(timezone.utc)
+        ops.append(UpdateOne({'ownerId': owner_id, 'word': doc['word']}, {'$set': doc}, upsert=True))
+        lines.append(line)
+        if len(ops) >= batch_size:
+            _flush(collection, ops, lines, summary)
+            ops, lines = [], []
+    if ops:
+        _flush(collection, ops, lines, summary)
+    return summary
+
+def _export_row(doc):
+    return {
+        'word': doc.get('word', ''),
+        'translation': doc.get('translation', ''),
+        'partOfSpeech': doc.get('partOfSpeech') or doc.get('part_of_speech', ''),
+        'examples': doc.get('examples') or [],
+        'categories': doc.get('categories') or [],
+    }
+
+def export_rows(docs, fmt):
+    # Yields one line at a time; the caller streams them straight to the response or a file.
+    if fmt == 'csv':
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        writer.writerow(FIELDS)
+        for doc in docs:
+            row = _export_row(doc)
+            writer.writerow([row['word'], row['translation'], row['partOfSpeech'],
+                             LIST_SEPARATOR.join(row['examples']), LIST_SEPARATOR.join(row['categories'])])
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+        yield buf.getvalue()
+        return
+    for doc in docs:
+        yield json.dumps(_export_row(doc), ensure_ascii=False) + '\n'